@@ -0,0 +1,86 @@
+import importlib.util
+import threading
+import time
+
+
+class ConnectionMetrics:
+    """
+    Métricas de conexión de un cliente HTTP, seguras entre threads.
+    Se alimentan con los event hooks de httpx y el trace de httpcore,
+    así que cuentan conexiones TCP/TLS nuevas además de requests.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.total_elapsed = 0.0
+        self.status_codes = {}
+        self.http_versions = {}
+
+    def on_request(self, request):
+        request.extensions['trace'] = self._trace
+        request.extensions['started_at'] = time.monotonic()
+
+    def on_response(self, response):
+        elapsed = time.monotonic() - response.request.extensions.get('started_at', time.monotonic())
+        http_version = response.extensions.get('http_version', b'').decode() or 'unknown'
+        with self.lock:
+            self.requests += 1
+            self.total_elapsed += elapsed
+            self.status_codes[response.status_code] = self.status_codes.get(response.status_code, 0) + 1
+            self.http_versions[http_version] = self.http_versions.get(http_version, 0) + 1
+            if response.status_code >= 400:
+                self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'connections_opened': self.connections_opened,
+                'tls_handshakes': self.tls_handshakes,
+                # Requests por conexión: > 1 significa que el keep-alive está funcionando
+                'reuse_ratio': self.requests / self.connections_opened if self.connections_opened else None,
+                'avg_latency': self.total_elapsed / self.requests if self.requests else None,
+                'status_codes': dict(self.status_codes),
+                'http_versions': dict(self.http_versions)
+            }
+
+    def _trace(self, event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            with self.lock:
+                self.connections_opened += 1
+        elif event_name == 'connection.start_tls.complete':
+            with self.lock:
+                self.tls_handshakes += 1
+
+
+def create_http_client(timeout=60, connect_timeout=10, max_connections=20, metrics=None):
+    """
+    Crea un cliente httpx de larga vida con pool de conexiones y keep-alive.
+    Usa HTTP/2 si el paquete h2 está instalado.
+
+    Args:
+        timeout (float): Timeout de lectura/escritura en segundos
+        connect_timeout (float): Timeout de conexión en segundos
+        max_connections (int): Tamaño del pool
+        metrics (ConnectionMetrics, optional): Métricas a alimentar con los event hooks
+
+    Returns:
+        httpx.Client: Cliente listo para pasar como http_client a los SDKs de OpenAI/Anthropic
+    """
+    import httpx
+
+    event_hooks = {}
+    if metrics is not None:
+        event_hooks = {'request': [metrics.on_request], 'response': [metrics.on_response]}
+
+    return httpx.Client(
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        http2=importlib.util.find_spec('h2') is not None,
+        event_hooks=event_hooks
+    )
@@ -1,20 +1,494 @@
-import requests
-import anthropic
-from openai import OpenAI
 from decouple import Config, RepositoryEnv
-import voyageai
-import google.generativeai as genai
 from io import BytesIO
-import requests
-from PIL import Image
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import hashlib
+import random
+import json
+import threading
+import time
+import os
+import sys
+sys.path.append('/home/snparada/Spacionatural/Libraries/')
+
+
+# Modelos de texto soportados por proveedor
+TEXT_MODELS = {
+    'openai': ['gpt-4o-mini', 'gpt-4o', 'o1-mini', 'o1', 'o1-mini-2024-09-12'],
+    'anthropic': ['claude-3-5-sonnet-20241022', 'claude-3-5-sonnet', 'claude-3-5-haiku-20241022'],
+    'perplexity': ['llama-3.1-sonar-large-128k-online'],
+    'gemini': ['gemini-1.5-flash', 'gemini-1.5-pro']
+}
+
+# Lado mayor óptimo de las imágenes por proveedor de visión; más grande solo suma tokens
+VISION_MAX_DIMENSIONS = {
+    'claude': 1568,
+    'gemini': 3072
+}
+
+# Nombres cortos de Claude y su versión con visión
+CLAUDE_VISION_MODELS = {
+    'claude-3-5-sonnet': 'claude-3-5-sonnet-20241022',
+    'claude-3-5-haiku': 'claude-3-5-haiku-20241022'
+}
+
+# Límites por request de cada proveedor de embeddings
+EMBEDDING_BATCH_LIMITS = {
+    'text-embedding-3-small': {'max_items': 2048, 'max_tokens': 300000},
+    'text-embedding-3-large': {'max_items': 2048, 'max_tokens': 300000},
+    'voyage-2': {'max_items': 128, 'max_tokens': 320000},
+    'voyage-large-2': {'max_items': 128, 'max_tokens': 120000}
+}
+
+# Dimensión por defecto de cada modelo de embeddings
+EMBEDDING_DIMENSIONS = {
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+    'voyage-2': 1024,
+    'voyage-large-2': 1536
+}
+
+
+class RateLimiter:
+    """
+    Token bucket de requests y tokens por minuto, seguro entre threads.
+    Un límite en None no se aplica.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute or 0
+        self.available_tokens = tokens_per_minute or 0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def configure(self, requests_per_minute=None, tokens_per_minute=None):
+        """Cambia los límites sin perder el consumo ya registrado; None deja el límite actual"""
+        with self.lock:
+            self._refill()
+            if requests_per_minute is not None and requests_per_minute != self.requests_per_minute:
+                if not self.requests_per_minute:
+                    self.available_requests = requests_per_minute
+                self.requests_per_minute = requests_per_minute
+                self.available_requests = min(self.available_requests, requests_per_minute)
+            if tokens_per_minute is not None and tokens_per_minute != self.tokens_per_minute:
+                if not self.tokens_per_minute:
+                    self.available_tokens = tokens_per_minute
+                self.tokens_per_minute = tokens_per_minute
+                self.available_tokens = min(self.available_tokens, tokens_per_minute)
+
+    def acquire(self, tokens=0):
+        while True:
+            with self.lock:
+                self._refill()
+                request_ok = not self.requests_per_minute or self.available_requests >= 1
+                # Un request más grande que el presupuesto completo pasa cuando el bucket está lleno
+                needed_tokens = min(tokens, self.tokens_per_minute or 0)
+                tokens_ok = not self.tokens_per_minute or self.available_tokens >= needed_tokens
+                if request_ok and tokens_ok:
+                    if self.requests_per_minute:
+                        self.available_requests -= 1
+                    if self.tokens_per_minute:
+                        self.available_tokens -= needed_tokens
+                    return
+                wait = 0.0
+                if not request_ok:
+                    wait = max(wait, (1 - self.available_requests) * 60 / self.requests_per_minute)
+                if not tokens_ok:
+                    wait = max(wait, (needed_tokens - self.available_tokens) * 60 / self.tokens_per_minute)
+            time.sleep(wait)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.requests_per_minute:
+            self.available_requests = min(self.requests_per_minute, self.available_requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self.available_tokens = min(self.tokens_per_minute, self.available_tokens + elapsed * self.tokens_per_minute / 60)
+
+
+class EmbeddingCache:
+    """
+    Caché persistente de embeddings en SQLite, direccionada por contenido:
+    clave = sha256(modelo + texto normalizado), valor = vector float32.
+    Evicta por tamaño (los menos usados primero) y lleva estadísticas de aciertos.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        import sqlite3
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                dim INTEGER,
+                vector BLOB,
+                size INTEGER,
+                last_access REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self.conn.commit()
+        # Total de bytes llevado en memoria; se lee de la tabla una sola vez
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """
+        Returns:
+            dict: índice en texts -> numpy.ndarray float32, solo para los aciertos
+        """
+        import numpy as np
+        keys = [self._key(model, text) for text in texts]
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = list(set(keys[start:start + 500]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk)
+                found.update({key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows})
+            if found:
+                now = time.time()
+                self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                self.conn.commit()
+
+            vectors = {i: found[key] for i, key in enumerate(keys) if key in found}
+            self.hits += len(vectors)
+            self.misses += len(keys) - len(vectors)
+        return vectors
+
+    def set_many(self, model, texts, vectors):
+        import numpy as np
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            if vector.size == 0 or np.isnan(vector).any():
+                continue
+            blob = vector.tobytes()
+            key = self._key(model, text)
+            rows[key] = (key, model, vector.size, blob, len(blob), now)
+        with self.lock:
+            # Las claves que ya existen se reemplazan: se descuenta su tamaño anterior
+            keys = list(rows)
+            replaced = 0
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                replaced += self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", chunk).fetchone()[0]
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)", list(rows.values()))
+            self.conn.commit()
+            self.total_bytes += sum(row[4] for row in rows.values()) - replaced
+            self._evict()
+
+    def stats(self):
+        with self.lock:
+            entries, total_bytes = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': total_bytes
+        }
+
+    def _evict(self):
+        if not self.max_bytes or self.total_bytes <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC"):
+            if self.total_bytes <= self.max_bytes:
+                break
+            stale.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        self.conn.commit()
+
+    def _key(self, model, text):
+        normalized = " ".join(str(text).split())
+        return hashlib.sha256(f"{model}\0{normalized}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Caché de respuestas de texto: LRU en memoria con TTL y, opcionalmente,
+    respaldo en disco (SQLite) que sobrevive entre ejecuciones.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, path=None, prune_interval=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self.pruned_at = 0.0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        if path:
+            import sqlite3
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created_at REAL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+            self.conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and not self._expired(entry[0], now):
+                self.entries.move_to_end(key)
+                return entry[1]
+            self.entries.pop(key, None)
+
+            if self.conn:
+                row = self.conn.execute("SELECT created_at, value FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and not self._expired(row[0], now):
+                    self._remember(key, row[0], row[1])
+                    return row[1]
+        return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, value)
+            if self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, value, now))
+                # Las filas vencidas se borran cada prune_interval segundos, no en cada escritura;
+                # get ya ignora las vencidas mientras tanto
+                if self.ttl is not None and now - self.pruned_at >= self.prune_interval:
+                    self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+                    self.pruned_at = now
+                self.conn.commit()
+
+    def _remember(self, key, created_at, value):
+        self.entries[key] = (created_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+
+class VisionImageCache:
+    """
+    Preprocesamiento de imágenes para visión: descarga una vez cada URL, normaliza a
+    JPEG RGB reducido al lado máximo del proveedor y reutiliza el resultado (bytes y
+    base64) entre llamadas y proveedores. Las imágenes se identifican por hash de
+    contenido, así que la misma imagen en dos URLs se procesa una sola vez.
+    """
+
+    def __init__(self, http_client=None, max_entries=256, cache_dir=None, jpeg_quality=90, max_raw_entries=32):
+        self.http_client = http_client
+        self.max_entries = max_entries
+        self.max_raw_entries = max_raw_entries
+        self.cache_dir = cache_dir
+        self.jpeg_quality = jpeg_quality
+        self.sources = {}
+        self.entries = OrderedDict()
+        self.raw = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(os.path.join(cache_dir, 'raw'), exist_ok=True)
+
+    def prepare(self, image, max_dimension):
+        """
+        Args:
+            image (str or file-like): URL, ruta local, bytes o BytesIO
+            max_dimension (int): Lado mayor máximo en pixeles
+
+        Returns:
+            dict: sha256, media_type, data (bytes JPEG), base64, width y height
+        """
+        source_key = self._source_key(image)
+        with self.lock:
+            sha256 = self.sources.get(source_key) if source_key else None
+
+        raw = None
+        if sha256 is None:
+            raw = self._read(image)
+            sha256 = hashlib.sha256(raw).hexdigest()
+            self._set_raw(sha256, raw)
+            if source_key:
+                with self.lock:
+                    self.sources[source_key] = sha256
+
+        # Si la imagen original ya cabe en max_dimension sirve la versión sin reducir
+        for key in ((sha256, 'original'), (sha256, max_dimension)):
+            entry = self._get(key)
+            if entry and (key[1] != 'original' or max(entry['width'], entry['height']) <= max_dimension):
+                return entry
+
+        if raw is None:
+            # Otro tamaño de una imagen ya vista: se usa el original guardado antes que descargarla de nuevo
+            raw = self._get_raw(sha256)
+            if raw is None:
+                raw = self._read(image)
+                self._set_raw(sha256, raw)
+        entry = self._normalize(raw, sha256, max_dimension)
+        self._set((sha256, max_dimension if entry['resized'] else 'original'), entry)
+        return entry
+
+    def _normalize(self, raw, sha256, max_dimension):
+        from PIL import Image
+
+        img = Image.open(BytesIO(raw))
+        resized = max(img.size) > max_dimension
+        if resized:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        output = BytesIO()
+        img.save(output, format='JPEG', quality=self.jpeg_quality, optimize=True)
+        data = output.getvalue()
+        return {
+            'sha256': sha256,
+            'media_type': 'image/jpeg',
+            'data': data,
+            'base64': base64.b64encode(data).decode('utf-8'),
+            'width': img.size[0],
+            'height': img.size[1],
+            'resized': resized
+        }
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries.move_to_end(key)
+                return entry
+
+        path = self._cache_path(key)
+        if path and os.path.exists(path):
+            from PIL import Image
+
+            with open(path, 'rb') as file:
+                data = file.read()
+            width, height = Image.open(BytesIO(data)).size
+            entry = {
+                'sha256': key[0],
+                'media_type': 'image/jpeg',
+                'data': data,
+                'base64': base64.b64encode(data).decode('utf-8'),
+                'width': width,
+                'height': height,
+                'resized': key[1] != 'original'
+            }
+            self._set(key, entry, persist=False)
+            return entry
+        return None
+
+    def _set(self, key, entry, persist=True):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        path = self._cache_path(key)
+        if persist and path:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(entry['data'])
+            os.replace(tmp_path, path)
+
+    def _get_raw(self, sha256):
+        with self.lock:
+            if sha256 in self.raw:
+                self.raw.move_to_end(sha256)
+                return self.raw[sha256]
+        path = os.path.join(self.cache_dir, 'raw', sha256) if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, 'rb') as file:
+                return file.read()
+        return None
+
+    def _set_raw(self, sha256, raw):
+        with self.lock:
+            self.raw[sha256] = raw
+            while len(self.raw) > self.max_raw_entries:
+                self.raw.popitem(last=False)
+        path = os.path.join(self.cache_dir, 'raw', sha256) if self.cache_dir else None
+        if path and not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(raw)
+            os.replace(tmp_path, path)
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key[0]}_{key[1]}.jpg") if self.cache_dir else None
+
+    def _source_key(self, image):
+        if not isinstance(image, str):
+            return None
+        if image.startswith(('http://', 'https://')):
+            return image
+        # Un archivo local se reconoce por ruta, tamaño y fecha de modificación
+        stat = os.stat(image)
+        return f"{os.path.abspath(image)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _read(self, image):
+        if isinstance(image, bytes):
+            return image
+        if not isinstance(image, str):
+            return image.read()
+        if image.startswith(('http://', 'https://')):
+            if self.http_client:
+                response = self.http_client.get(image, follow_redirects=True)
+            else:
+                import requests
+                response = requests.get(image)
+            response.raise_for_status()
+            return response.content
+        with open(image, 'rb') as file:
+            return file.read()
 
 
 class LLM:
-    def __init__(self):
+    def __init__(self, embedding_cache_path=None, embedding_cache_max_bytes=None, response_cache_path=None, response_cache_size=1024, response_cache_ttl=3600, timeout=60, connect_timeout=10, max_connections=20, vision_cache_dir=None, vision_cache_size=256):
+        """
+        Args:
+            embedding_cache_path (str, optional): Archivo SQLite para la caché de embeddings.
+                Si es None no se usa caché.
+            embedding_cache_max_bytes (int, optional): Tamaño máximo de la caché de embeddings
+            response_cache_path (str, optional): Archivo SQLite para persistir la caché de
+                respuestas de generate_text. Si es None la caché vive solo en memoria.
+            response_cache_size (int, optional): Entradas en memoria de la caché de respuestas
+            response_cache_ttl (int, optional): Segundos de validez de una respuesta en caché
+            timeout (float, optional): Timeout de lectura/escritura de las llamadas HTTP
+            connect_timeout (float, optional): Timeout de conexión de las llamadas HTTP
+            max_connections (int, optional): Tamaño del pool de conexiones de cada proveedor
+            vision_cache_dir (str, optional): Carpeta para persistir las imágenes ya normalizadas
+            vision_cache_size (int, optional): Imágenes normalizadas que se mantienen en memoria
+        """
         # Configuración del archivo .env
         env_path = "/home/snparada/Spacionatural/Libraries/LLM_lib/.env"
         self.env_config = Config(RepositoryEnv(env_path))
+        self.embedding_cache = EmbeddingCache(embedding_cache_path, embedding_cache_max_bytes) if embedding_cache_path else None
+        self.response_cache = ResponseCache(response_cache_size, response_cache_ttl, response_cache_path)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+        # Los SDKs, los clientes HTTP (uno con pool y keep-alive por proveedor) y PIL se
+        # importan y crean recién cuando se usa el proveedor; ver _lazy
+        self._http_settings = (timeout, connect_timeout, max_connections)
+        self._vision_settings = (vision_cache_size, vision_cache_dir)
+        self.connection_metrics = {}
+        self.http_clients = {}
+        self._clients = {}
+        self._clients_lock = threading.RLock()
+
         self._init_openai()
         self._init_anthropic()
         self._init_perplexity()
@@ -23,7 +497,6 @@ class LLM:
         
     def _init_openai(self):
         self.openai_key = self.env_config('API_KEY')
-        self.openai_client = OpenAI(api_key=self.openai_key)
         self.openai_headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.openai_key}"
@@ -32,52 +505,403 @@ class LLM:
 
     def _init_anthropic(self):
         self.anthropic_key = self.env_config('ANTHROPIC_API_KEY')
-        self.claude_client = anthropic.Anthropic(api_key=self.anthropic_key)
 
     def _init_perplexity(self):
         self.perplexity_key = self.env_config('PERPLEXITY_API_KEY')
-        self.perplexity_client = OpenAI(
-            api_key=self.perplexity_key,
-            base_url="https://api.perplexity.ai"
-        )
 
     def _init_voyage(self):
         self.voyage_key = self.env_config('ANTHROPIC_API_KEY')
-        self.voyage_client = voyageai.Client(api_key=self.voyage_key)
 
     def _init_gemini(self):
         self.gemini_key = self.env_config('GEMINI_API_KEY')
-        genai.configure(api_key=self.gemini_key)
+
+    @property
+    def openai_client(self):
+        def create():
+            from openai import OpenAI
+            return OpenAI(api_key=self.openai_key, http_client=self._http_client('openai'))
+        return self._lazy('openai', create)
+
+    @property
+    def claude_client(self):
+        def create():
+            import anthropic
+            return anthropic.Anthropic(api_key=self.anthropic_key, http_client=self._http_client('anthropic'))
+        return self._lazy('anthropic', create)
+
+    @property
+    def perplexity_client(self):
+        def create():
+            from openai import OpenAI
+            return OpenAI(
+                api_key=self.perplexity_key,
+                base_url="https://api.perplexity.ai",
+                http_client=self._http_client('perplexity')
+            )
+        return self._lazy('perplexity', create)
+
+    @property
+    def voyage_client(self):
+        def create():
+            import voyageai
+            return voyageai.Client(api_key=self.voyage_key)
+        return self._lazy('voyage', create)
+
+    @property
+    def genai(self):
+        """Módulo google.generativeai, configurado con la API key en el primer uso"""
+        def create():
+            import google.generativeai as genai
+            genai.configure(api_key=self.gemini_key)
+            return genai
+        return self._lazy('gemini', create)
+
+    @property
+    def vision_cache(self):
+        def create():
+            size, cache_dir = self._vision_settings
+            return VisionImageCache(self._http_client('images'), size, cache_dir)
+        return self._lazy('vision_cache', create)
+
+    def _http_client(self, provider):
+        def create():
+            from LLM_lib.http_client import ConnectionMetrics, create_http_client
+            self.connection_metrics[provider] = ConnectionMetrics()
+            self.http_clients[provider] = create_http_client(*self._http_settings, self.connection_metrics[provider])
+            return self.http_clients[provider]
+        return self._lazy(f"http:{provider}", create)
+
+    def _lazy(self, name, create):
+        client = self._clients.get(name)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = create()
+                    self._clients[name] = client
+        return client
+
+    def rate_limiter(self, provider, requests_per_minute=None, tokens_per_minute=None):
+        """
+        Limitador compartido del proveedor: todas las llamadas de esta instancia
+        (generate_text, generate_text_many, generate_embeddings) consumen el mismo presupuesto.
+
+        Args:
+            provider (str): 'openai', 'anthropic', 'perplexity', 'gemini' o 'voyage'
+            requests_per_minute (int, optional): Nuevo límite de requests por minuto
+            tokens_per_minute (int, optional): Nuevo límite de tokens por minuto
+
+        Returns:
+            RateLimiter: El limitador del proveedor; sin límites configurados no espera nunca
+        """
+        limiter = self._lazy(f"limiter:{provider}", RateLimiter)
+        if requests_per_minute is not None or tokens_per_minute is not None:
+            limiter.configure(requests_per_minute, tokens_per_minute)
+        return limiter
+
+    def get_connection_metrics(self):
+        """
+        Returns:
+            dict: Métricas de conexión por proveedor (requests, conexiones abiertas,
+                reutilización, latencia promedio, status codes y versión HTTP)
+        """
+        return {provider: metrics.snapshot() for provider, metrics in self.connection_metrics.items()}
+
+    def close(self):
+        for client in self.http_clients.values():
+            client.close()
 
     def generate_embedding(self, text, model="text-embedding-3-small"):
+        if self.embedding_cache:
+            cached = self.embedding_cache.get_many(model, [text])
+            if cached:
+                return cached[0].tolist()
+
         # Modelos OpenAI
         if model in ['text-embedding-3-large', 'text-embedding-3-small']:
-            return self._get_openai_embedding(text, model)
+            embedding = self._get_openai_embedding(text, model)
         # Modelos Voyage
         elif model in ['voyage-2', 'voyage-large-2']:
-            return self._get_voyage_embedding(text, model)
+            embedding = self._get_voyage_embedding(text, model)
         else:
             raise ValueError(f"Modelo no soportado: {model}")
 
-    def generate_text(self, content, model="gpt-4o-mini", max_tokens=1024, temperature=0.7, stream=False):
+        if self.embedding_cache and embedding:
+            self.embedding_cache.set_many(model, [text], [embedding])
+        return embedding
+
+    def generate_embeddings(self, texts, model="text-embedding-3-small", max_workers=4, requests_per_minute=None, tokens_per_minute=None, dimensions=None):
+        """
+        Genera embeddings para muchos textos en batches del tamaño que permite el proveedor.
+        
+        Args:
+            texts (list): Textos a embeber
+            model (str): Modelo de embeddings
+            max_workers (int): Batches enviados en paralelo
+            requests_per_minute (int, optional): Límite de requests por minuto, compartido
+                con las demás llamadas al proveedor (ver rate_limiter)
+            tokens_per_minute (int, optional): Límite de tokens por minuto
+            dimensions (int, optional): Dimensión de salida (solo modelos text-embedding-3)
+        
+        Returns:
+            numpy.ndarray: Matriz float32 (len(texts), dim) en el mismo orden que texts.
+                Las filas de batches que fallaron quedan en NaN; si no se embebió
+                ninguna, dim es `dimensions` o la dimensión por defecto del modelo.
+        """
+        if model not in EMBEDDING_BATCH_LIMITS:
+            raise ValueError(f"Modelo no soportado: {model}")
+
+        texts = list(texts)
+        # Los textos repetidos se embeben una sola vez y se copian a cada posición
+        positions = {}
+        for i, text in enumerate(texts):
+            positions.setdefault(text, []).append(i)
+        unique = list(positions)
+
+        # Solo se embeben los textos que no están en la caché
+        cache_model = f"{model}:{dimensions}" if dimensions else model
+        cached = self.embedding_cache.get_many(cache_model, unique) if self.embedding_cache else {}
+        missing = [i for i in range(len(unique)) if i not in cached]
+
+        batches = [
+            ([missing[i] for i in indices], tokens)
+            for indices, tokens in self._pack_embedding_batches([unique[i] for i in missing], model)
+        ]
+        provider = 'openai' if model.startswith('text-embedding') else 'voyage'
+        limiter = self.rate_limiter(provider, requests_per_minute, tokens_per_minute)
+
+        def embed(batch):
+            indices, tokens = batch
+            limiter.acquire(tokens)
+            try:
+                return indices, self._embed_batch([unique[i] for i in indices], model, dimensions)
+            except Exception as err:
+                print(f"Error en batch de embeddings ({len(indices)} textos): {err}")
+                return indices, None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(embed, batches))
+
+        import numpy as np
+        dim = next((len(vectors[0]) for _, vectors in results if vectors), None)
+        if dim is None:
+            dim = len(next(iter(cached.values()))) if cached else (dimensions or EMBEDDING_DIMENSIONS[model])
+        matrix = np.full((len(unique), dim), np.nan, dtype=np.float32)
+        for i, vector in cached.items():
+            matrix[i] = vector
+        for indices, vectors in results:
+            if vectors:
+                matrix[indices] = np.asarray(vectors, dtype=np.float32)
+                if self.embedding_cache:
+                    self.embedding_cache.set_many(cache_model, [unique[i] for i in indices], vectors)
+
+        if len(unique) == len(texts):
+            return matrix
+        rows = np.empty(len(texts), dtype=np.intp)
+        for i, text in enumerate(unique):
+            rows[positions[text]] = i
+        return matrix[rows]
+
+    def embed_table(self, db, table_name, key_column, text_column, vector_column='embedding', model="text-embedding-3-small", conditions=None, **kwargs):
+        """
+        Lee textos de una tabla, los embebe en batch y escribe los vectores en una
+        columna vector(1536) usando database_lib.DB.
+        
+        Args:
+            db (DB): Instancia de database_lib.DB
+            table_name (str): Nombre de la tabla
+            key_column (str): Columna que identifica cada fila
+            text_column (str): Columna con el texto a embeber
+            vector_column (str): Columna vector de destino
+            model (str): Modelo de embeddings
+            conditions (dict, optional): Filtro de filas (formato de DB.read_table_in_df)
+            **kwargs: Argumentos adicionales para generate_embeddings
+        
+        Returns:
+            int: Número de filas actualizadas
+        """
+        df = db.read_table_in_df(table_name, [key_column, text_column], conditions=conditions, use_cache=False)
+        if df.empty:
+            return 0
+        vectors = self.generate_embeddings(df[text_column].fillna('').astype(str).tolist(), model, **kwargs)
+        return db.update_vector_column(table_name, key_column, vector_column, df[key_column].tolist(), vectors)
+
+    def generate_text(self, content, model="gpt-4o-mini", max_tokens=1024, temperature=0.7, stream=False, cache=None):
+        """
+        Args:
+            stream (bool): Si es True retorna un generador de eventos, igual para todos los proveedores:
+                {'type': 'delta', 'text': ...} por cada fragmento y al final
+                {'type': 'done', 'text': texto_completo, 'usage': {'input_tokens', 'output_tokens'}}
+                o {'type': 'error', 'error': ..., 'text': texto_parcial} si la llamada falla.
+            cache (bool, optional): None usa la caché solo con temperature 0; True la fuerza
+                y False la desactiva. Las llamadas idénticas en curso se agrupan en una sola.
+        """
+        provider = self._provider_for_model(model)
+        limiter = self.rate_limiter(provider)
+        if stream:
+            limiter.acquire(self._estimate_tokens(str(content)) + max_tokens)
+            return self._stream_text(content, model, max_tokens, temperature)
+
+        def dispatch():
+            limiter.acquire(self._estimate_tokens(str(content)) + max_tokens)
+            return self._dispatch_text(content, model, max_tokens, temperature)
+
+        use_cache = (temperature == 0) if cache is None else cache
+        if use_cache:
+            key = self._response_cache_key(provider, model, content, temperature, max_tokens)
+            return self._generate_cached(key, dispatch)
+        return dispatch()
+
+    def generate_text_many(self, prompts, model="gpt-4o-mini", concurrency=8, requests_per_minute=None, tokens_per_minute=None, max_tokens=1024, temperature=0.7, max_retries=5, backoff_factor=1, cache=None):
+        """
+        Genera respuestas para muchos prompts en paralelo, respetando los límites del proveedor.
+        Los errores 429/5xx y de conexión se reintentan con backoff exponencial.
+        
+        Args:
+            prompts (list): Prompts a procesar (por ejemplo una columna de un DataFrame)
+            model (str): Modelo a utilizar
+            concurrency (int): Requests en paralelo
+            requests_per_minute (int, optional): Límite de requests por minuto del proveedor.
+                Se guarda en el limitador compartido del proveedor (ver rate_limiter)
+            tokens_per_minute (int, optional): Límite de tokens por minuto del proveedor
+            max_retries (int): Reintentos por prompt ante errores transitorios
+            backoff_factor (float): Segundos base del backoff exponencial
+            cache (bool, optional): Igual que en generate_text
+        
+        Returns:
+            list: Un dict {'result', 'error'} por prompt, en el mismo orden que prompts.
+                Sirve directo para pd.DataFrame(results, index=df.index).
+        """
+        provider = self._provider_for_model(model)
+        prompts = list(prompts)
+        limiter = self.rate_limiter(provider, requests_per_minute, tokens_per_minute)
+        use_cache = (temperature == 0) if cache is None else cache
+
+        def call(prompt):
+            for attempt in range(max_retries + 1):
+                limiter.acquire(self._estimate_tokens(str(prompt)) + max_tokens)
+                try:
+                    return self._dispatch_text(prompt, model, max_tokens, temperature, raise_errors=True)
+                except Exception as err:
+                    if not self._is_retryable_error(err) or attempt == max_retries:
+                        raise
+                    time.sleep(backoff_factor * (2 ** attempt) + random.uniform(0, backoff_factor))
+
+        def generate(prompt):
+            try:
+                if use_cache:
+                    key = self._response_cache_key(provider, model, prompt, temperature, max_tokens)
+                    result = self._generate_cached(key, lambda: call(prompt))
+                else:
+                    result = call(prompt)
+                return {'result': result, 'error': None}
+            except Exception as err:
+                return {'result': None, 'error': str(err)}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(generate, prompts))
+
+        errors = sum(1 for r in results if r['error'])
+        if errors:
+            print(f"generate_text_many: {errors} de {len(prompts)} prompts fallaron")
+        return results
+
+    def _dispatch_text(self, content, model, max_tokens, temperature, raise_errors=False):
+        provider = self._provider_for_model(model)
+
         # Modelos de OpenAI
-        if model in ['gpt-4o-mini', 'gpt-4o','o1-mini','o1','o1-mini-2024-09-12']:
-            return self._generate_with_openai(content, model, max_tokens, temperature)
+        if provider == 'openai':
+            return self._generate_with_openai(content, model, max_tokens, temperature, raise_errors)
             
         # Modelos de Claude
-        elif model in ['claude-3-5-sonnet-20241022', 'claude-3-5-sonnet','claude-3-5-haiku-20241022']:
-            return self._generate_with_claude(content, model, max_tokens, temperature)
+        elif provider == 'anthropic':
+            return self._generate_with_claude(content, model, max_tokens, temperature, raise_errors)
             
         # Modelos de Perplexity
-        elif model == "llama-3.1-sonar-large-128k-online":
-            return self._generate_with_perplexity(content, model, stream)
+        elif provider == 'perplexity':
+            return self._generate_with_perplexity(content, model, raise_errors)
             
         # Modelos de Gemini
-        elif model in ['gemini-1.5-flash', 'gemini-1.5-pro']:
-            return self._generate_with_gemini(content, model, max_tokens, temperature, stream)
-            
         else:
-            raise ValueError(f"Modelo no soportado: {model}")
+            return self._generate_with_gemini(content, model, max_tokens, temperature, raise_errors)
+
+    def _response_cache_key(self, provider, model, content, temperature, max_tokens):
+        return hashlib.sha256(json.dumps([provider, model, content, temperature, max_tokens], default=str).encode('utf-8')).hexdigest()
+
+    def _is_retryable_error(self, err):
+        # requests expone el status en err.response; los SDKs de OpenAI/Anthropic en status_code y Google en code
+        response = getattr(err, 'response', None)
+        status = getattr(err, 'status_code', None) or getattr(response, 'status_code', None) or getattr(err, 'code', None)
+        if isinstance(status, int):
+            return status in (408, 409, 429) or status >= 500
+        return isinstance(err, (ConnectionError, TimeoutError)) \
+            or any(name in type(err).__name__ for name in ('Connect', 'Timeout', 'RateLimit', 'ResourceExhausted', 'RemoteProtocol'))
+
+    def _stream_text(self, content, model, max_tokens, temperature):
+        provider = self._provider_for_model(model)
+        streams = {
+            'openai': self._stream_with_openai,
+            'anthropic': self._stream_with_claude,
+            'perplexity': self._stream_with_perplexity,
+            'gemini': self._stream_with_gemini
+        }
+        return self._stream_events(provider, streams[provider](content, model, max_tokens, temperature))
+
+    def _stream_events(self, provider, stream):
+        # Convierte los ('delta'|'usage', valor) de un _stream_with_* en los eventos públicos
+        parts = []
+        usage = {}
+        try:
+            for kind, value in stream:
+                if kind == 'delta':
+                    parts.append(value)
+                    yield {'type': 'delta', 'text': value}
+                else:
+                    usage = value
+        except Exception as err:
+            print(f"Error en streaming de {provider}: {err}")
+            yield {'type': 'error', 'error': str(err), 'text': ''.join(parts)}
+            return
+        yield {'type': 'done', 'text': ''.join(parts), 'usage': usage}
+
+    def _provider_for_model(self, model):
+        for provider, models in TEXT_MODELS.items():
+            if model in models:
+                return provider
+        raise ValueError(f"Modelo no soportado: {model}")
+
+    def _generate_cached(self, key, generate):
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Si la misma request ya está en curso, se espera su resultado en vez de repetirla
+        with self._inflight_lock:
+            inflight = self._inflight.get(key)
+            is_leader = inflight is None
+            if is_leader:
+                inflight = {'event': threading.Event(), 'result': None, 'error': None}
+                self._inflight[key] = inflight
+
+        if not is_leader:
+            inflight['event'].wait()
+            if inflight['error'] is not None:
+                raise inflight['error']
+            return inflight['result']
+
+        try:
+            result = generate()
+            if result is not None:
+                self.response_cache.set(key, result)
+            inflight['result'] = result
+            return result
+        except Exception as err:
+            inflight['error'] = err
+            raise
+        finally:
+            inflight['event'].set()
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
 
     def generate_by_image_or_text(self, content, image_path=None, image_url=None, model="gemini-1.5-pro", max_tokens=1024, temperature=0.7, stream=False):
         """
@@ -86,29 +910,29 @@ class LLM:
         Args:
             content (str): El texto de la prompt
             image_path (str, optional): Ruta local a la imagen
-            image_url (str, optional): URL de la imagen
+            image_url (str, optional): URL de la imagen. Las imágenes se descargan y
+                reducen una sola vez (ver VisionImageCache)
             model (str): Modelo a utilizar
             max_tokens (int): Número máximo de tokens
             temperature (float): Temperatura para la generación
-            stream (bool): Si se debe transmitir la respuesta
+            stream (bool): Si es True retorna el mismo generador de eventos que generate_text
         """
         try:
             # Si tenemos una imagen (ya sea URL o path local)
             if image_path or image_url:
-                # Descargar la imagen si es una URL
-                if image_url:
-                    import requests
-                    from io import BytesIO
-                    
-                    response = requests.get(image_url)
-                    image_data = BytesIO(response.content)
-                else:
-                    image_data = image_path
-
                 if model.startswith('gemini'):
-                    return self._generate_with_gemini_vision(content, image_data, model, max_tokens, temperature, stream)
+                    image = self.vision_cache.prepare(image_url or image_path, VISION_MAX_DIMENSIONS['gemini'])
+                    parts = [content, self._gemini_image_part(image)]
+                    if stream:
+                        return self._stream_events('gemini', self._stream_with_gemini(parts, model, max_tokens, temperature))
+                    return self._generate_with_gemini_vision(parts, model, max_tokens, temperature)
                 elif model.startswith('claude'):
-                    return self._generate_with_claude_vision(content, image_data, model, max_tokens, temperature)
+                    image = self.vision_cache.prepare(image_url or image_path, VISION_MAX_DIMENSIONS['claude'])
+                    blocks = self._claude_image_content(content, image)
+                    model = CLAUDE_VISION_MODELS.get(model, model)
+                    if stream:
+                        return self._stream_events('anthropic', self._stream_with_claude(blocks, model, max_tokens, temperature))
+                    return self._generate_with_claude_vision(blocks, model, max_tokens, temperature)
                 else:
                     raise ValueError(f"El modelo {model} no soporta procesamiento de imágenes")
             
@@ -121,7 +945,7 @@ class LLM:
 
 #----------------------------------TEXT----------------------------------
 
-    def _generate_with_openai(self, content, model, max_tokens, temperature):
+    def _generate_with_openai(self, content, model, max_tokens, temperature, raise_errors=False):
         # Configuración base
         data = {
             "model": model,
@@ -138,7 +962,7 @@ class LLM:
             data["temperature"] = float(temperature)
 
         try:
-            response = requests.post(
+            response = self._http_client('openai').post(
                 f"{self.openai_base_url}/chat/completions",
                 headers=self.openai_headers,
                 json=data
@@ -152,10 +976,12 @@ class LLM:
                 print("No se encontraron 'choices' en la respuesta de GPT.")
                 return None
         except Exception as err:
+            if raise_errors:
+                raise
             print(f"Error en OpenAI: {err}")
             return None
 
-    def _generate_with_claude(self, content, model, max_tokens, temperature):
+    def _generate_with_claude(self, content, model, max_tokens, temperature, raise_errors=False):
         try:
             messages = [{"role": "user", "content": content}]
             response = self.claude_client.messages.create(
@@ -166,34 +992,32 @@ class LLM:
             )
             return response.content[0].text
         except Exception as err:
+            if raise_errors:
+                raise
             print(f"Error en Claude: {err}")
             return None
 
-    def _generate_with_perplexity(self, content, model, stream=False):
+    def _generate_with_perplexity(self, content, model, raise_errors=False):
         messages = [
             {"role": "system", "content": "Se preciso y conciso."},
             {"role": "user", "content": content}
         ]
 
         try:
-            if not stream:
-                response = self.perplexity_client.chat.completions.create(
-                    model=model,
-                    messages=messages
-                )
-                return response.choices[0].message.content.strip()
-            else:
-                return self.perplexity_client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    stream=True
-                )
+            response = self.perplexity_client.chat.completions.create(
+                model=model,
+                messages=messages
+            )
+            return response.choices[0].message.content.strip()
         except Exception as err:
+            if raise_errors:
+                raise
             print(f"Error en Perplexity: {err}")
             return None
 
-    def _generate_with_gemini(self, content, model, max_tokens, temperature, stream=False):
+    def _generate_with_gemini(self, content, model, max_tokens, temperature, raise_errors=False):
         try:
+            genai = self.genai
             gemini_model = genai.GenerativeModel(model)
             
             # Configurar los parámetros de generación
@@ -203,24 +1027,90 @@ class LLM:
             )
             
             # Generar respuesta
-            if not stream:
-                response = gemini_model.generate_content(
-                    content,
-                    generation_config=generation_config
-                )
-                return response.text
-            else:
-                return gemini_model.generate_content(
-                    content,
-                    generation_config=generation_config,
-                    stream=True
-                )
+            response = gemini_model.generate_content(
+                content,
+                generation_config=generation_config
+            )
+            return response.text
                 
         except Exception as err:
+            if raise_errors:
+                raise
             print(f"Error en Gemini: {err}")
             return None
 
 
+#----------------------------------STREAMING----------------------------------
+# Cada método produce ('delta', texto) por fragmento y un ('usage', dict) final
+
+    def _stream_with_openai(self, content, model, max_tokens, temperature):
+        params = {"model": model, "messages": [{"role": "user", "content": content}]}
+        if model in ['o1', 'o1-mini', 'o1-mini-2024-09-12']:
+            params["max_completion_tokens"] = int(max_tokens)
+        else:
+            params["max_tokens"] = int(max_tokens)
+            params["temperature"] = float(temperature)
+        # OpenAI solo envía el uso en el último chunk si se pide explícitamente
+        params["stream_options"] = {"include_usage": True}
+
+        yield from self._stream_openai_compatible(self.openai_client, params)
+
+    def _stream_with_perplexity(self, content, model, max_tokens, temperature):
+        params = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "Se preciso y conciso."},
+                {"role": "user", "content": content}
+            ]
+        }
+        yield from self._stream_openai_compatible(self.perplexity_client, params)
+
+    def _stream_openai_compatible(self, client, params):
+        usage = None
+        for chunk in client.chat.completions.create(stream=True, **params):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield 'delta', chunk.choices[0].delta.content
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+
+        yield 'usage', {
+            'input_tokens': usage.prompt_tokens if usage else None,
+            'output_tokens': usage.completion_tokens if usage else None
+        }
+
+    def _stream_with_claude(self, content, model, max_tokens, temperature):
+        with self.claude_client.messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=[{"role": "user", "content": content}]
+        ) as stream:
+            for text in stream.text_stream:
+                yield 'delta', text
+            usage = stream.get_final_message().usage
+
+        yield 'usage', {'input_tokens': usage.input_tokens, 'output_tokens': usage.output_tokens}
+
+    def _stream_with_gemini(self, content, model, max_tokens, temperature):
+        genai = self.genai
+        gemini_model = genai.GenerativeModel(model)
+        generation_config = genai.types.GenerationConfig(
+            max_output_tokens=max_tokens,
+            temperature=temperature
+        )
+        response = gemini_model.generate_content(content, generation_config=generation_config, stream=True)
+        for chunk in response:
+            # Los chunks sin partes (p. ej. solo safety ratings) no tienen .text
+            if chunk.parts:
+                yield 'delta', chunk.text
+
+        usage = getattr(response, 'usage_metadata', None)
+        yield 'usage', {
+            'input_tokens': getattr(usage, 'prompt_token_count', None),
+            'output_tokens': getattr(usage, 'candidates_token_count', None)
+        }
+
+
 #----------------------------------EMBEDDINGS----------------------------------
 
     def _get_openai_embedding(self, text, model):
@@ -247,19 +1137,43 @@ class LLM:
             print(f"Error en Voyage Embeddings: {err}")
             return None
 
+    def _embed_batch(self, texts, model, dimensions=None):
+        if model in ['text-embedding-3-large', 'text-embedding-3-small']:
+            # OpenAI rechaza strings vacíos
+            inputs = [text.replace("\n", " ") or " " for text in texts]
+            params = {'input': inputs, 'model': model}
+            if dimensions:
+                params['dimensions'] = dimensions
+            response = self.openai_client.embeddings.create(**params)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        else:
+            return self.voyage_client.embed(texts, model=model).embeddings
+
+    def _pack_embedding_batches(self, texts, model):
+        # Agrupa índices respetando el máximo de textos y de tokens por request
+        limits = EMBEDDING_BATCH_LIMITS[model]
+        batches, indices, tokens = [], [], 0
+        for i, text in enumerate(texts):
+            text_tokens = self._estimate_tokens(text)
+            if indices and (len(indices) >= limits['max_items'] or tokens + text_tokens > limits['max_tokens']):
+                batches.append((indices, tokens))
+                indices, tokens = [], 0
+            indices.append(i)
+            tokens += text_tokens
+        if indices:
+            batches.append((indices, tokens))
+        return batches
+
+    def _estimate_tokens(self, text):
+        # Aproximación de ~4 caracteres por token, con margen
+        return len(text) // 3 + 1
+
 #----------------------------------VISION----------------------------------
 
-    def _generate_with_gemini_vision(self, content, image_data, model, max_tokens, temperature, stream=False):
+    def _generate_with_gemini_vision(self, parts, model, max_tokens, temperature):
         try:
-            import PIL.Image
-            
-            # Cargar la imagen
-            if isinstance(image_data, str):
-                image = PIL.Image.open(image_data)
-            else:
-                image = PIL.Image.open(image_data)
-            
             # Configurar el modelo
+            genai = self.genai
             gemini_model = genai.GenerativeModel(model)
             generation_config = genai.types.GenerationConfig(
                 max_output_tokens=max_tokens,
@@ -267,113 +1181,23 @@ class LLM:
             )
             
             # Generar respuesta
-            if not stream:
-                response = gemini_model.generate_content(
-                    [content, image],
-                    generation_config=generation_config
-                )
-                return response.text
-            else:
-                return gemini_model.generate_content(
-                    [content, image],
-                    generation_config=generation_config,
-                    stream=True
-                )
+            response = gemini_model.generate_content(
+                parts,
+                generation_config=generation_config
+            )
+            return response.text
                 
         except Exception as err:
             print(f"Error en Gemini Vision: {err}")
             return None
 
-    def _generate_with_claude_vision(self, content, image_data, model, max_tokens, temperature):
+    def _generate_with_claude_vision(self, blocks, model, max_tokens, temperature):
         try:
-            # Add required imports at the beginning of the method
-            from io import BytesIO
-            import requests
-            from PIL import Image
-            import base64
-
-            # Map model names to their vision-capable versions
-            vision_model_mapping = {
-                'claude-3-5-sonnet': 'claude-3-5-sonnet-20241022',
-                'claude-3-5-haiku': 'claude-3-5-haiku-20241022'
-            }
-            model_to_use = vision_model_mapping.get(model, model)
-            
-            # Handle image data
-            if isinstance(image_data, str):
-                if image_data.startswith(('http://', 'https://')):
-                    import requests
-                    from PIL import Image
-                    from io import BytesIO
-                    
-                    # Download image
-                    response = requests.get(image_data, verify=False)
-                    if response.status_code != 200:
-                        raise Exception(f"Failed to download image. Status code: {response.status_code}")
-                    
-                    # Open with PIL to handle format conversion if needed
-                    img = Image.open(BytesIO(response.content))
-                    
-                    # Convert to RGB if necessary (handles RGBA PNG)
-                    if img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    
-                    # Save to BytesIO in JPEG format
-                    output = BytesIO()
-                    img.save(output, format='JPEG', quality=95)
-                    image_bytes = output.getvalue()
-                    media_type = 'image/jpeg'
-                else:
-                    # Handle local file
-                    from PIL import Image
-                    img = Image.open(image_data)
-                    if img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    output = BytesIO()
-                    img.save(output, format='JPEG', quality=95)
-                    image_bytes = output.getvalue()
-                    media_type = 'image/jpeg'
-            else:
-                # Handle BytesIO input
-                from PIL import Image
-                img = Image.open(image_data)
-                if img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                output = BytesIO()
-                img.save(output, format='JPEG', quality=95)
-                image_bytes = output.getvalue()
-                media_type = 'image/jpeg'
-
-            # Encode to base64
-            import base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            
-            # Create message with correct structure
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": base64_image
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": content
-                        }
-                    ]
-                }
-            ]
-            
             response = self.claude_client.messages.create(
-                model=model_to_use,
+                model=model,
                 max_tokens=max_tokens,
                 temperature=temperature,
-                messages=messages
+                messages=[{"role": "user", "content": blocks}]
             )
             return response.content[0].text
             
@@ -382,3 +1206,24 @@ class LLM:
             import traceback
             print(traceback.format_exc())
             return None
+
+    def _gemini_image_part(self, image):
+        # La imagen ya viene normalizada por VisionImageCache
+        return {'mime_type': image['media_type'], 'data': image['data']}
+
+    def _claude_image_content(self, content, image):
+        # Bloques imagen + texto; el base64 viene de VisionImageCache
+        return [
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": image['media_type'],
+                    "data": image['base64']
+                }
+            },
+            {
+                "type": "text",
+                "text": content
+            }
+        ]
@@ -1,9 +1,15 @@
 import os
-import requests
+import sys
 import json
-from openai import OpenAI
+import tempfile
+import time
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import anthropic
 from decouple import Config, RepositoryEnv
+sys.path.append('/home/snparada/Spacionatural/Libraries/')
+from LLM_lib.http_client import ConnectionMetrics, create_http_client
 
 # Constantes de modelos soportados
 SUPPORTED_CLAUDE_MODELS = [
@@ -23,11 +29,263 @@ SUPPORTED_GPT_MODELS = [
     'text-embedding-ada-002'
 ]
 
+# Límites por batch de cada proveedor (cantidad de requests y tamaño del archivo)
+BATCH_LIMITS = {
+    'claude': {'max_requests': 100000, 'max_bytes': 256 * 1024 * 1024},
+    'gpt': {'max_requests': 50000, 'max_bytes': 200 * 1024 * 1024}
+}
+
+class BatchJob:
+    """
+    Handle de un trabajo batch que puede estar repartido en varios batches del proveedor.
+    """
+
+    def __init__(self, llm_batch, model, batches):
+        self.llm_batch = llm_batch
+        self.model = model
+        self.batches = batches
+
+    @property
+    def batch_ids(self):
+        return [batch['batch_id'] for batch in self.batches if batch['batch_id']]
+
+    def status(self):
+        """Retorna {batch_id: estado} de cada batch"""
+        return {batch_id: self.llm_batch.get_batch_status(batch_id, self.model) for batch_id in self.batch_ids}
+
+    def is_done(self):
+        return all(self.llm_batch._is_batch_finished(status, self.model) for status in self.status().values())
+
+    def results(self):
+        """Retorna el contenido JSONL de cada batch, en el orden de los shards"""
+        return [self.llm_batch.get_batch_results(batch_id, self.model) for batch_id in self.batch_ids]
+
+    def iter_results(self):
+        """Itera los resultados normalizados de todos los shards (ver LLMBatch.iter_batch_results)"""
+        for batch_id in self.batch_ids:
+            yield from self.llm_batch.iter_batch_results(batch_id, self.model)
+
+    def cancel(self):
+        return {batch_id: self.llm_batch.cancel_batch(batch_id, self.model) for batch_id in self.batch_ids}
+
+    def to_dict(self):
+        return {'model': self.model, 'batches': self.batches}
+
+RESULT_COLUMNS = ['custom_id', 'batch_id', 'status', 'content', 'error', 'input_tokens', 'output_tokens']
+
+class BatchJobManager:
+    """
+    Sigue muchos batches a la vez: hace polling con backoff y guarda el estado en un
+    JSON, así un reinicio retoma el seguimiento donde quedó. Los resultados se leen
+    en streaming hacia un DataFrame o un dataset Parquet, indexados por custom_id.
+    """
+
+    def __init__(self, llm_batch, state_path, poll_interval=30, max_poll_interval=600, backoff=2):
+        self.llm_batch = llm_batch
+        self.state_path = state_path
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.state = self._load_state()
+
+    def track(self, job, model=None):
+        """
+        Agrega batches al seguimiento.
+
+        Args:
+            job (BatchJob or str): Handle de process_batch o un batch_id suelto
+            model (str, optional): Modelo del batch, requerido si job es un batch_id
+        """
+        if isinstance(job, BatchJob):
+            batches = [(batch['batch_id'], job.model) for batch in job.batches if batch['batch_id']]
+        else:
+            if not model:
+                raise ValueError("Se requiere el modelo para seguir un batch_id")
+            batches = [(job, model)]
+
+        for batch_id, batch_model in batches:
+            self.state['batches'].setdefault(batch_id, {
+                'model': batch_model,
+                'status': None,
+                'finished': False,
+                'collected': False,
+                'tracked_at': time.time(),
+                'updated_at': None
+            })
+        self._save_state()
+
+    def pending(self):
+        return [batch_id for batch_id, batch in self.state['batches'].items() if not batch['finished']]
+
+    def poll(self):
+        """
+        Consulta una vez el estado de los batches pendientes.
+
+        Returns:
+            list: batch_ids que terminaron en esta consulta
+        """
+        finished = []
+        for batch_id in self.pending():
+            batch = self.state['batches'][batch_id]
+            try:
+                status = self.llm_batch.get_batch_status(batch_id, batch['model'])
+            except Exception as e:
+                print(f"Error consultando el batch {batch_id}: {str(e)}")
+                continue
+            batch['status'] = status.get('status') or status.get('processing_status')
+            batch['failed'] = batch['status'] in ('failed', 'expired', 'cancelled')
+            batch['updated_at'] = time.time()
+            if self.llm_batch._is_batch_finished(status, batch['model']):
+                batch['finished'] = True
+                finished.append(batch_id)
+        self._save_state()
+        return finished
+
+    def wait(self, timeout=None):
+        """
+        Hace polling hasta que todos los batches terminen. El intervalo crece con
+        backoff mientras no hay cambios y vuelve al mínimo cuando alguno termina.
+
+        Returns:
+            dict: Estado de todos los batches
+        """
+        started_at = time.time()
+        interval = self.poll_interval
+        while self.pending():
+            finished = self.poll()
+            if not self.pending():
+                break
+            if timeout is not None and time.time() - started_at + interval > timeout:
+                raise TimeoutError(f"Quedan {len(self.pending())} batches sin terminar")
+            interval = self.poll_interval if finished else min(interval * self.backoff, self.max_poll_interval)
+            time.sleep(interval)
+        return self.state['batches']
+
+    def collect(self, path=None, chunk_size=10000, include_collected=False):
+        """
+        Lee en streaming los resultados de los batches terminados y aún no recolectados.
+        Un batch queda marcado como recolectado solo cuando sus filas ya están en el
+        DataFrame retornado o escritas en su archivo Parquet. Si falla la lectura de un
+        batch se informa, se omite y queda pendiente para el próximo collect.
+
+        Args:
+            path (str, optional): Si se indica, es una carpeta (dataset Parquet, requiere
+                pyarrow) donde cada batch se escribe como un archivo part nuevo
+            chunk_size (int): Filas por bloque
+            include_collected (bool): Volver a leer también los ya recolectados
+
+        Returns:
+            pandas.DataFrame or list: Resultados indexados por custom_id, o las rutas
+                de los archivos Parquet escritos en esta llamada
+        """
+        batch_ids = [
+            batch_id for batch_id, batch in self.state['batches'].items()
+            if batch['finished'] and (include_collected or not batch['collected'])
+        ]
+
+        if path is None:
+            frames = []
+            collected = []
+            for batch_id in batch_ids:
+                try:
+                    batch_frames = list(self._iter_result_chunks(batch_id, chunk_size))
+                except Exception as e:
+                    self._collect_failed(batch_id, e)
+                    continue
+                frames.extend(batch_frames)
+                collected.append(batch_id)
+            df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=RESULT_COLUMNS)
+            df = df.set_index('custom_id')
+            self._mark_collected(collected)
+            return df
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow es necesario para exportar a Parquet: pip install pyarrow")
+
+        schema = pa.schema([
+            ('custom_id', pa.string()), ('batch_id', pa.string()), ('status', pa.string()),
+            ('content', pa.string()), ('error', pa.string()),
+            ('input_tokens', pa.int64()), ('output_tokens', pa.int64())
+        ])
+        os.makedirs(path, exist_ok=True)
+        parts = []
+        for batch_id in batch_ids:
+            # Un archivo por batch y por llamada; se escribe a .tmp y se publica al terminar
+            part_path = os.path.join(path, f"part-{time.time_ns()}-{batch_id}.parquet")
+            tmp_path = f"{part_path}.tmp"
+            try:
+                with pq.ParquetWriter(tmp_path, schema) as writer:
+                    for df in self._iter_result_chunks(batch_id, chunk_size):
+                        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                os.replace(tmp_path, part_path)
+            except Exception as e:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                self._collect_failed(batch_id, e)
+                continue
+            parts.append(part_path)
+            self._mark_collected([batch_id])
+        return parts
+
+    def _iter_result_chunks(self, batch_id, chunk_size):
+        batch = self.state['batches'][batch_id]
+        rows = []
+        for record in self.llm_batch.iter_batch_results(batch_id, batch['model']):
+            rows.append(record)
+            if len(rows) >= chunk_size:
+                yield self._results_dataframe(rows)
+                rows = []
+        if rows:
+            yield self._results_dataframe(rows)
+
+    def _collect_failed(self, batch_id, error):
+        print(f"Error leyendo los resultados del batch {batch_id}: {str(error)}")
+        self.state['batches'][batch_id]['collect_error'] = str(error)
+        self._save_state()
+
+    def _mark_collected(self, batch_ids):
+        for batch_id in batch_ids:
+            batch = self.state['batches'][batch_id]
+            batch['collected'] = True
+            batch.pop('collect_error', None)
+        self._save_state()
+
+    def _results_dataframe(self, rows):
+        df = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+        df['input_tokens'] = df['input_tokens'].astype('Int64')
+        df['output_tokens'] = df['output_tokens'].astype('Int64')
+        return df
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {'batches': {}}
+        with open(self.state_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file)
+        os.replace(tmp_path, self.state_path)
+
 class LLMBatch:
-    def __init__(self):
+    def __init__(self, timeout=120, connect_timeout=10, max_connections=10):
         # Configuración del archivo .env
         env_path = "/home/notorios/Notorios/Libraries/LLM_lib/.env"
         self.env_config = Config(RepositoryEnv(env_path))
+
+        # Un cliente HTTP con pool y keep-alive por proveedor, con sus métricas
+        self.connection_metrics = {}
+        self.http_clients = {}
+        for provider in ('openai', 'anthropic'):
+            self.connection_metrics[provider] = ConnectionMetrics()
+            self.http_clients[provider] = create_http_client(timeout, connect_timeout, max_connections, self.connection_metrics[provider])
         
         # Inicializar clientes
         self._init_openai()
@@ -44,100 +302,159 @@ class LLMBatch:
 
     def _init_anthropic(self):
         self.anthropic_key = self.env_config('ANTHROPIC_API_KEY')
-        self.claude_client = anthropic.Anthropic(api_key=self.anthropic_key)
+        self.claude_client = anthropic.Anthropic(api_key=self.anthropic_key, http_client=self.http_clients['anthropic'])
+        self.anthropic_headers = {
+            "x-api-key": self.anthropic_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+
+    def get_connection_metrics(self):
+        """Métricas de conexión por proveedor (ver ConnectionMetrics.snapshot)"""
+        return {provider: metrics.snapshot() for provider, metrics in self.connection_metrics.items()}
+
+    def close(self):
+        for client in self.http_clients.values():
+            client.close()
 
     # Método principal de procesamiento
-    def process_batch(self, requests, metadata=None):
+    def process_batch(self, requests, metadata=None, output_dir=None, max_workers=4):
         """
-        Procesa una lista de requests en batch
-        Retorna el batch_id para seguimiento
+        Procesa requests en batch. Si superan los límites del proveedor (cantidad de
+        requests o MB por archivo) se reparten en varios archivos JSONL que se envían
+        como batches en paralelo.
+
+        Args:
+            requests (iterable): Requests con 'model' y 'messages'. Puede ser un generador;
+                se escriben a disco a medida que se leen.
+            metadata (dict, optional): Metadata para cada batch (se agrega 'shard')
+            output_dir (str, optional): Carpeta para los JSONL. Por defecto una carpeta temporal
+            max_workers (int): Shards subidos en paralelo
+
+        Returns:
+            BatchJob: Handle con todos los batches creados. El JSONL de cada shard enviado
+                se borra; solo quedan en disco los de shards que fallaron, para reintentarlos.
         """
+        temp_dir = None
+        if output_dir is None:
+            output_dir = temp_dir = tempfile.mkdtemp(prefix="llm_batch_")
         try:
-            # Verificar que todos los requests usen el mismo modelo
-            models = set(req.get("model") for req in requests)
-            if len(models) != 1:
-                raise ValueError("Todos los requests deben usar el mismo modelo")
-            model = next(iter(models))
-            
-            # Validar modelo
-            model_type = self._validate_model(model)
-
-            # Crear y subir archivo JSONL
-            input_file = self.create_batch_file(requests)
-            print(f"Archivo batch creado: {input_file}")
-            
-            file_response = self.upload_batch_file(input_file, model)
-            if 'id' not in file_response:
-                print("Error en la respuesta de upload_batch_file:", file_response)
-                raise Exception("No se pudo obtener el ID del archivo subido")
-            print(f"Archivo subido con ID: {file_response['id']}")
-            
-            # Crear batch
-            batch_response = self.create_batch(file_response['id'], model, metadata)            
-            if 'id' not in batch_response:
-                print("Error en la respuesta de create_batch:", batch_response)
-                raise Exception("No se pudo obtener el ID del batch")
-                
-            return batch_response['id']
+            shards = self.create_batch_files(requests, output_dir)
+            model = shards[0]['model']
+            print(f"Archivos batch creados: {len(shards)} ({sum(s['requests'] for s in shards)} requests)")
+
+            def submit(shard_number):
+                shard = shards[shard_number]
+                shard_metadata = {**(metadata or {}), 'shard': f"{shard_number + 1}/{len(shards)}"}
+                file_response = self.upload_batch_file(shard['file'], model)
+                if 'id' not in file_response:
+                    print("Error en la respuesta de upload_batch_file:", file_response)
+                    raise Exception("No se pudo obtener el ID del archivo subido")
+
+                batch_response = self.create_batch(file_response['id'], model, shard_metadata)
+                if 'id' not in batch_response:
+                    print("Error en la respuesta de create_batch:", batch_response)
+                    raise Exception("No se pudo obtener el ID del batch")
+                # El proveedor ya tiene el contenido del shard
+                os.remove(shard['file'])
+                return batch_response['id']
+
+            batches = []
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(submit, i) for i in range(len(shards))]
+                for shard, future in zip(shards, futures):
+                    try:
+                        batches.append({**shard, 'batch_id': future.result(), 'error': None})
+                    except Exception as e:
+                        print(f"Error enviando {shard['file']}: {str(e)}")
+                        batches.append({**shard, 'batch_id': None, 'error': str(e)})
+
+            if all(batch['batch_id'] is None for batch in batches):
+                raise Exception("No se pudo crear ningún batch")
+            return BatchJob(self, model, batches)
         except Exception as e:
             print(f"Error en process_batch: {str(e)}")
             raise
+        finally:
+            # La carpeta temporal se borra si no quedaron shards fallidos
+            if temp_dir and not os.listdir(temp_dir):
+                os.rmdir(temp_dir)
 
     # Métodos de creación de archivos batch
     def create_batch_file(self, requests, output_file="batch_input.jsonl"):
-        """Crea un archivo JSONL para procesar en batch con validaciones"""
-        # OpenAI permite 50,000 requests, Claude 100,000
-        if requests.get("model").startswith("claude"):
-            max_requests = 100000
-        else:
-            max_requests = 50000
-        
-        if len(requests) > max_requests:
-            raise ValueError(f"Máximo {max_requests} requests por batch. Recibidos: {len(requests)}")
-        
-        models = set(req.get("model") for req in requests)
-        if len(models) > 1:
-            raise ValueError(f"Todos los requests deben usar el mismo modelo. Modelos encontrados: {models}")
-
-        model = next(iter(models))
-        
-        with open(output_file, 'w') as f:
-            if model in ['gpt-4o-mini', 'gpt-4o']:
-                self._create_openai_batch_entries(requests, f)
-            elif model in ['claude-3-5-sonnet-20240620', 'claude-3-5-sonnet']:
-                self._create_claude_batch_entries(requests, f)
-            
-        # Validar límites según documentación
-        file_size_mb = os.path.getsize(output_file) / (1024 * 1024)
-        if self._validate_model(model) == "claude":
-            if file_size_mb > 256:  # Claude: 256 MB
-                raise ValueError(f"El archivo supera el límite de 256MB para Claude")
-            if len(requests) > 100000:
-                raise ValueError("Claude permite máximo 100,000 requests por batch")
-        else:  # OpenAI
-            if file_size_mb > 200:  # OpenAI: 200 MB
-                raise ValueError(f"El archivo supera el límite de 200MB para OpenAI")
-            if len(requests) > 50000:
-                raise ValueError("OpenAI permite máximo 50,000 requests por batch")
-        
+        """Crea un único archivo JSONL para procesar en batch; falla si excede los límites"""
+        output_dir = os.path.dirname(os.path.abspath(output_file))
+        shards = self.create_batch_files(requests, output_dir, prefix=os.path.splitext(os.path.basename(output_file))[0])
+        if len(shards) > 1:
+            limits = BATCH_LIMITS[self._validate_model(shards[0]['model'])]
+            for shard in shards:
+                os.remove(shard['file'])
+            raise ValueError(f"Máximo {limits['max_requests']} requests y {limits['max_bytes'] // (1024 * 1024)}MB por batch. Usa process_batch para dividirlos.")
+        os.replace(shards[0]['file'], output_file)
         return output_file
 
-    def _create_openai_batch_entries(self, requests, file):
-        for i, request in enumerate(requests):
-            batch_request = {
-                "custom_id": f"request-{i}",
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": request.get("model", "gpt-4o"),
-                    "messages": request["messages"],
-                    "max_tokens": request.get("max_tokens", 1000),
-                    "temperature": request.get("temperature", 0.7)
-                }
+    def create_batch_files(self, requests, output_dir=None, prefix="batch_input"):
+        """
+        Escribe los requests en uno o más archivos JSONL que respetan los límites
+        del proveedor, sin construir el batch completo en memoria.
+        Los custom_id son globales (request-<índice>) salvo que el request traiga el suyo.
+
+        Returns:
+            list: Un dict por shard con 'file', 'model', 'requests', 'first_index' y 'last_index'
+        """
+        output_dir = output_dir or tempfile.mkdtemp(prefix="llm_batch_")
+        os.makedirs(output_dir, exist_ok=True)
+
+        shards = []
+        file = None
+        model = None
+        try:
+            for i, request in enumerate(requests):
+                if model is None:
+                    model = request.get("model")
+                    model_type = self._validate_model(model)
+                    limits = BATCH_LIMITS[model_type]
+                elif request.get("model") != model:
+                    raise ValueError(f"Todos los requests deben usar el mismo modelo. Modelos encontrados: {model}, {request.get('model')}")
+
+                entry = self._claude_batch_entry(i, request) if model_type == "claude" else self._openai_batch_entry(i, request)
+                line = (json.dumps(entry) + '\n').encode('utf-8')
+
+                shard = shards[-1] if shards else None
+                if shard is None or shard['requests'] >= limits['max_requests'] or shard['bytes'] + len(line) > limits['max_bytes']:
+                    if file:
+                        file.close()
+                    path = os.path.join(output_dir, f"{prefix}_{len(shards):03d}.jsonl")
+                    file = open(path, 'wb')
+                    shard = {'file': path, 'model': model, 'requests': 0, 'bytes': 0, 'first_index': i, 'last_index': i}
+                    shards.append(shard)
+
+                file.write(line)
+                shard['requests'] += 1
+                shard['bytes'] += len(line)
+                shard['last_index'] = i
+        finally:
+            if file:
+                file.close()
+
+        if not shards:
+            raise ValueError("No hay requests para procesar")
+        return shards
+
+    def _openai_batch_entry(self, i, request):
+        return {
+            "custom_id": request.get("custom_id", f"request-{i}"),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": request.get("model", "gpt-4o"),
+                "messages": request["messages"],
+                "max_tokens": request.get("max_tokens", 1000),
+                "temperature": request.get("temperature", 0.7)
             }
-            file.write(json.dumps(batch_request) + '\n')
+        }
 
-    def _create_claude_batch_entries(self, requests, file):
+    def _claude_batch_entry(self, i, request):
         """
         Formato correcto para Claude según documentación:
         {
@@ -152,50 +469,46 @@ class LLMBatch:
             }
         }
         """
-        for i, request in enumerate(requests):
-            messages = request["messages"]
-            # Validar formato de mensajes para Claude
-            for msg in messages:
-                if msg["role"] == "system":
-                    # Claude maneja system messages de manera diferente
-                    messages = [{"role": "system", "content": msg["content"]}] + [
-                        m for m in messages if m["role"] != "system"
-                    ]
-                    break
-
-            batch_request = {
-                "custom_id": f"request-{i}",
-                "params": {
-                    "model": request.get("model"),
-                    "messages": messages,
-                    "max_tokens": request.get("max_tokens", 1000),
-                    "temperature": request.get("temperature", 0.7)
-                }
+        messages = request["messages"]
+        # Validar formato de mensajes para Claude
+        for msg in messages:
+            if msg["role"] == "system":
+                # Claude maneja system messages de manera diferente
+                messages = [{"role": "system", "content": msg["content"]}] + [
+                    m for m in messages if m["role"] != "system"
+                ]
+                break
+
+        return {
+            "custom_id": request.get("custom_id", f"request-{i}"),
+            "params": {
+                "model": request.get("model"),
+                "messages": messages,
+                "max_tokens": request.get("max_tokens", 1000),
+                "temperature": request.get("temperature", 0.7)
             }
-            file.write(json.dumps(batch_request) + '\n')
+        }
 
     # Métodos de gestión de batches
     def upload_batch_file(self, file_path, model):
         """Sube el archivo JSONL para procesamiento en batch"""
-        if model in ['gpt-4o-mini', 'gpt-4o']:
+        if self._validate_model(model) == "gpt":
             return self._upload_openai_batch(file_path)
-        elif model in ['claude-3-5-sonnet-20240620', 'claude-3-5-sonnet']:
-            return self._upload_claude_batch(file_path)
         else:
-            raise ValueError(f"Modelo no soportado para procesamiento en batch: {model}")
+            return self._upload_claude_batch(file_path)
 
     def create_batch(self, input_file_id, model, metadata=None):
         """Crea un nuevo batch job"""
-        if model in ['gpt-4o-mini', 'gpt-4o']:
+        if self._validate_model(model) == "gpt":
             return self._create_openai_batch(input_file_id, metadata)
-        elif model in ['claude-3-5-sonnet-20240620', 'claude-3-5-sonnet']:
+        else:
             return self._create_claude_batch(input_file_id, metadata)
 
     def get_batch_status(self, batch_id, model):
         """Obtiene el estado detallado de un batch"""
-        if model in ['gpt-4o-mini', 'gpt-4o']:
+        if self._validate_model(model) == "gpt":
             return self._get_openai_batch_status(batch_id)
-        elif model in ['claude-3-5-sonnet-20240620', 'claude-3-5-sonnet']:
+        else:
             return self._get_claude_batch_status(batch_id)
 
     def get_batch_results(self, batch_id, model):
@@ -203,40 +516,86 @@ class LLMBatch:
         Obtiene los resultados de un batch completado.
         Los resultados están disponibles por 29 días para Claude y 24h para OpenAI
         """
+        sources = self._result_sources(batch_id, model)
+        if not sources:
+            raise ValueError("No se encontró archivo de resultados")
+        client, url, headers = sources[0]
+        response = client.get(url, headers=headers)
+        response.raise_for_status()
+        return response.text  # Retorna el contenido JSONL
+
+    def iter_batch_results(self, batch_id, model):
+        """
+        Itera los resultados de un batch terminado línea a línea, sin cargar el archivo
+        completo en memoria. Incluye el archivo de errores de OpenAI si existe.
+
+        Yields:
+            dict: custom_id, batch_id, status, content, error, input_tokens y output_tokens
+        """
+        model_type = self._validate_model(model)
+        for client, url, headers in self._result_sources(batch_id, model):
+            with client.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line.strip():
+                        yield self._parse_result_line(json.loads(line), batch_id, model_type)
+
+    def _result_sources(self, batch_id, model):
         status = self.get_batch_status(batch_id, model)
-        
+        if not self._is_batch_finished(status, model):
+            raise ValueError("El batch aún no ha terminado")
+
         if self._validate_model(model) == "claude":
-            if status.get("processing_status") != "ended":
-                raise ValueError("El batch aún no ha terminado")
-            
             results_url = status.get("results_url")
             if not results_url:
                 raise ValueError("No se encontró URL de resultados")
-            
-            response = requests.get(
-                results_url,
-                headers={
-                    "x-api-key": self.anthropic_key,
-                    "anthropic-version": "2024-01-01"
-                }
-            )
-        else:  # OpenAI
-            if status.get("status") != "completed":
-                raise ValueError("El batch aún no ha terminado")
-            
-            output_file_id = status.get("output_file_id")
-            response = requests.get(
-                f"{self.openai_base_url}/files/{output_file_id}/content",
-                headers=self.openai_headers
-            )
-        
-        response.raise_for_status()
-        return response.text  # Retorna el contenido JSONL
+            return [(self.http_clients['anthropic'], results_url, self.anthropic_headers)]
+
+        # OpenAI: las respuestas exitosas y las fallidas vienen en archivos separados.
+        # Un batch failed/expired/cancelled puede no tener ninguno: no hay nada que leer
+        return [
+            (self.http_clients['openai'], f"{self.openai_base_url}/files/{file_id}/content", self.openai_headers)
+            for file_id in (status.get("output_file_id"), status.get("error_file_id")) if file_id
+        ]
+
+    def _parse_result_line(self, line, batch_id, model_type):
+        record = {
+            'custom_id': line.get('custom_id'),
+            'batch_id': batch_id,
+            'status': None,
+            'content': None,
+            'error': None,
+            'input_tokens': None,
+            'output_tokens': None
+        }
+        if model_type == "claude":
+            result = line.get('result', {})
+            record['status'] = result.get('type')
+            message = result.get('message') or {}
+            record['content'] = ''.join(block.get('text', '') for block in message.get('content', [])) or None
+            usage = message.get('usage') or {}
+            record['input_tokens'] = usage.get('input_tokens')
+            record['output_tokens'] = usage.get('output_tokens')
+            if result.get('error'):
+                record['error'] = json.dumps(result['error'])
+        else:
+            response = line.get('response') or {}
+            body = response.get('body') or {}
+            ok = response.get('status_code') == 200 and not line.get('error')
+            record['status'] = 'succeeded' if ok else 'errored'
+            if body.get('choices'):
+                record['content'] = body['choices'][0]['message'].get('content')
+            usage = body.get('usage') or {}
+            record['input_tokens'] = usage.get('prompt_tokens')
+            record['output_tokens'] = usage.get('completion_tokens')
+            if not ok:
+                record['error'] = json.dumps(line.get('error') or body.get('error') or body)
+        return record
 
     # Métodos específicos de OpenAI
     def _upload_openai_batch(self, file_path):
         with open(file_path, 'rb') as f:
-            response = requests.post(
+            response = self.http_clients['openai'].post(
                 f"{self.openai_base_url}/files",
                 headers={"Authorization": f"Bearer {self.openai_key}"},
                 files={"file": f},
@@ -254,30 +613,30 @@ class LLMBatch:
             data["metadata"] = metadata
 
         try:
-            response = requests.post(
+            response = self.http_clients['openai'].post(
                 f"{self.openai_base_url}/batches",
                 headers=self.openai_headers,
                 json=data
             )
             response.raise_for_status()
             return response.json()
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error en la solicitud HTTP: {str(e)}")
-            if hasattr(e.response, 'text'):
+            if getattr(e, 'response', None) is not None:
                 print(f"Respuesta del servidor: {e.response.text}")
             raise
 
     def _get_openai_batch_status(self, batch_id):
         try:
-            response = requests.get(
+            response = self.http_clients['openai'].get(
                 f"{self.openai_base_url}/batches/{batch_id}",
                 headers=self.openai_headers
             )
             response.raise_for_status()
             return response.json()
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error al obtener estado del batch: {str(e)}")
-            if hasattr(e.response, 'text'):
+            if getattr(e, 'response', None) is not None:
                 print(f"Respuesta del servidor: {e.response.text}")
             raise
 
@@ -287,46 +646,50 @@ class LLMBatch:
         return {"id": file_path}
 
     def _create_claude_batch(self, input_file_id, metadata=None):
-        with open(input_file_id, 'r') as f:
-            requests = [json.loads(line) for line in f]
-        
+        def body():
+            # Arma {"requests": [...], "metadata": {...}} leyendo el JSONL línea a línea,
+            # sin cargar el shard completo en memoria
+            yield b'{"requests": ['
+            with open(input_file_id, 'rb') as f:
+                separator = b''
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield separator + line
+                        separator = b','
+            yield b'], "metadata": ' + json.dumps(metadata or {}).encode('utf-8') + b'}'
+
         try:
-            response = requests.post(
+            response = self.http_clients['anthropic'].post(
                 "https://api.anthropic.com/v1/messages/batches",
-                headers={
-                    "x-api-key": self.anthropic_key,
-                    "anthropic-version": "2024-01-01",
-                    "content-type": "application/json"
-                },
-                json={
-                    "requests": requests,
-                    "metadata": metadata if metadata else {}
-                }
+                headers=self.anthropic_headers,
+                content=body()
             )
             response.raise_for_status()
             return response.json()
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error en la solicitud HTTP: {str(e)}")
             raise
 
     def _get_claude_batch_status(self, batch_id):
         try:
-            response = requests.get(
-                f"https://api.anthropic.com/v1/message_batches/{batch_id}",
-                headers={
-                    "x-api-key": self.anthropic_key,
-                    "anthropic-version": "2024-01-01",
-                    "content-type": "application/json"
-                }
+            response = self.http_clients['anthropic'].get(
+                f"https://api.anthropic.com/v1/messages/batches/{batch_id}",
+                headers=self.anthropic_headers
             )
             response.raise_for_status()
             return response.json()
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Error al obtener estado del batch: {str(e)}")
-            if hasattr(e.response, 'text'):
+            if getattr(e, 'response', None) is not None:
                 print(f"Respuesta del servidor: {e.response.text}")
             raise
 
+    def _is_batch_finished(self, status, model):
+        if self._validate_model(model) == "claude":
+            return status.get("processing_status") == "ended"
+        return status.get("status") in ("completed", "failed", "expired", "cancelled")
+
     def _validate_model(self, model):
         """Valida que el modelo esté soportado"""
         if model in SUPPORTED_CLAUDE_MODELS:
@@ -339,15 +702,12 @@ class LLMBatch:
     def cancel_batch(self, batch_id, model):
         """Cancela un batch en progreso"""
         if self._validate_model(model) == "claude":
-            response = requests.post(
-                f"https://api.anthropic.com/v1/message_batches/{batch_id}/cancel",
-                headers={
-                    "x-api-key": self.anthropic_key,
-                    "anthropic-version": "2024-01-01"
-                }
+            response = self.http_clients['anthropic'].post(
+                f"https://api.anthropic.com/v1/messages/batches/{batch_id}/cancel",
+                headers=self.anthropic_headers
             )
         else:  # OpenAI
-            response = requests.post(
+            response = self.http_clients['openai'].post(
                 f"{self.openai_base_url}/batches/{batch_id}/cancel",
                 headers=self.openai_headers
             )
@@ -1,12 +1,23 @@
-from sqlalchemy import create_engine, Table, Column, Integer, Text, Float, Boolean, MetaData, text
+from sqlalchemy import create_engine, inspect, Table, Column, Integer, Text, Float, Boolean, MetaData, text
 from urllib.parse import quote_plus
+from collections import OrderedDict
 from dotenv import load_dotenv
 import os
+import json
+import threading
+import time
 import pandas as pd
 
 
 class DB:
-    def __init__(self):
+    def __init__(self, query_cache_size=0, query_cache_ttl=300):
+        """
+        Args:
+            query_cache_size (int, optional): Número máximo de consultas de read_table_in_df
+                que se guardan en caché (LRU). 0 desactiva la caché. Default 0
+            query_cache_ttl (int, optional): Segundos que una entrada de la caché es válida.
+                None significa sin expiración. Default 300
+        """
         # Load database credentials
         env_path = os.path.join(os.path.dirname(__file__), '.env')
         load_dotenv(env_path)
@@ -38,6 +49,16 @@ class DB:
             'JSONB': 'JSONB'
         }
 
+        # Caché de consultas: clave -> (timestamp, DataFrame)
+        self.query_cache_size = query_cache_size
+        self.query_cache_ttl = query_cache_ttl
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        # Generación por tabla (y global): invalidate_query_cache la incrementa, así una
+        # lectura que empezó antes de una escritura no guarda su resultado ya obsoleto
+        self._query_cache_generations = {}
+        self._query_cache_generation = 0
+
     def create_new_table(self, table_name, columns):
         """Creates a new pulso table for a specific project if it doesn't exist
         
@@ -112,6 +133,7 @@ class DB:
                         """))
                 conn.commit()
 
+            self.invalidate_query_cache(table_name)
             print(f"Table {table_name} created successfully with the updated structure")
             return True
         except Exception as e:
@@ -156,6 +178,7 @@ class DB:
                     """))
                 
                 conn.commit()
+                self.invalidate_query_cache(table_name)
                 print(f"Columnas añadidas a la tabla {table_name} exitosamente")
                 
         except Exception as e:
@@ -199,32 +222,162 @@ class DB:
             print(f"Error al leer la tabla {table_name}: {e}")
             return []
 
-    def read_table_in_df(self, table_name, columns=None):
+    def read_table_in_df(self, table_name, columns=None, conditions=None, use_cache=True):
         """
         Lee la tabla del proyecto y devuelve un DataFrame de pandas.
         
         Args:
-            project (str): Nombre del proyecto
-            columns (list): Lista de columnas a seleccionar
+            table_name (str): Nombre de la tabla
+            columns (list, optional): Lista de columnas a seleccionar
+            conditions (dict, optional): Filtro con el mismo formato que delete_table_rows
+                ({'column': ..., 'operator': ..., 'value': ...})
+            use_cache (bool, optional): Si es False se ignora la caché de consultas
+                para esta lectura. Solo aplica si la instancia se creó con query_cache_size > 0
         
         Returns:
             pandas.DataFrame: DataFrame con los resultados
         """        
+        cache_key = None
+        if use_cache and self.query_cache_size:
+            cache_key = self._query_cache_key(table_name, columns, conditions)
+            cached_df = self._get_cached_query(cache_key)
+            if cached_df is not None:
+                return cached_df
+            generation = self._query_generation(table_name)
+
         try:
             with self.engine.connect() as conn:
                 if columns:
                     columns_str = ", ".join(columns)
-                    query = text(f"SELECT {columns_str} FROM {table_name}")
+                    base_query = f"SELECT {columns_str} FROM {table_name}"
                 else:
-                    query = text(f"SELECT * FROM {table_name}")
+                    base_query = f"SELECT * FROM {table_name}"
+
+                where_clause, params = self._build_where_clause(conditions)
+                query = text(f"{base_query} {where_clause}".strip())
                 
-                df = pd.read_sql(query, conn)
+                df = pd.read_sql(query, conn, params=params)
+
+                if cache_key is not None:
+                    self._set_cached_query(cache_key, df, generation)
                 return df
                 
         except Exception as e:
             print(f"Error al leer la tabla en DataFrame: {e}")
             return pd.DataFrame()
 
+    def load_dataframe(self, table_name, df, if_exists='append', chunksize=1000):
+        """
+        Carga masiva de un DataFrame en una tabla.
+        
+        Args:
+            table_name (str): Nombre de la tabla
+            df (pandas.DataFrame): Datos a insertar
+            if_exists (str, optional): 'append', 'replace' o 'fail'. Default 'append'
+            chunksize (int, optional): Filas por INSERT. Default 1000
+        
+        Returns:
+            bool: True si la carga fue exitosa, False en caso contrario
+        """
+        try:
+            with self.engine.connect() as conn:
+                df.to_sql(
+                    table_name,
+                    conn,
+                    schema='public',
+                    if_exists=if_exists,
+                    index=False,
+                    chunksize=chunksize,
+                    method='multi'
+                )
+                conn.commit()
+
+            self.invalidate_query_cache(table_name)
+            print(f"Se cargaron {len(df)} registros en {table_name}")
+            return True
+
+        except Exception as e:
+            print(f"Error al cargar registros en {table_name}: {e}")
+            return False
+
+    def replace_dataframe_rows(self, table_name, df, key_column, chunksize=1000):
+        """
+        Reemplaza en una sola transacción las filas cuyas claves vienen en el DataFrame:
+        borra las versiones anteriores e inserta las nuevas. Si algo falla no se aplica
+        ninguno de los dos pasos, así la tabla nunca queda con filas duplicadas.
+        
+        Args:
+            table_name (str): Nombre de la tabla (se crea si no existe)
+            df (pandas.DataFrame): Datos a insertar
+            key_column (str): Columna que identifica cada fila
+            chunksize (int, optional): Filas por INSERT. Default 1000
+        
+        Returns:
+            bool: True si el reemplazo fue exitoso, False en caso contrario
+        """
+        try:
+            with self.engine.begin() as conn:
+                if inspect(conn).has_table(table_name, schema='public'):
+                    where_clause, params = self._build_where_clause({
+                        'column': key_column, 'operator': 'IN', 'value': df[key_column].tolist()
+                    })
+                    conn.execute(text(f"DELETE FROM {table_name} {where_clause}"), params)
+                df.to_sql(
+                    table_name,
+                    conn,
+                    schema='public',
+                    if_exists='append',
+                    index=False,
+                    chunksize=chunksize,
+                    method='multi'
+                )
+
+            self.invalidate_query_cache(table_name)
+            print(f"Se reemplazaron {len(df)} registros en {table_name}")
+            return True
+
+        except Exception as e:
+            print(f"Error al reemplazar registros en {table_name}: {e}")
+            return False
+
+    def update_vector_column(self, table_name, key_column, vector_column, keys, vectors, chunksize=500):
+        """
+        Escribe vectores en una columna vector (pgvector), fila por fila según su clave.
+        
+        Args:
+            table_name (str): Nombre de la tabla
+            key_column (str): Columna que identifica cada fila
+            vector_column (str): Columna vector de destino (ej. vector(1536))
+            keys (list): Claves de las filas a actualizar
+            vectors (list or numpy.ndarray): Un vector por clave; los que contienen NaN se omiten
+            chunksize (int, optional): Filas por transacción. Default 500
+        
+        Returns:
+            int: Número de filas actualizadas
+        """
+        rows = [
+            {'key': key, 'vector': '[' + ','.join(repr(float(value)) for value in vector) + ']'}
+            for key, vector in zip(keys, vectors)
+            if len(vector) and all(value == value for value in vector)
+        ]
+        query = text(f"UPDATE {table_name} SET {vector_column} = CAST(:vector AS vector) WHERE {key_column} = :key")
+        
+        updated = 0
+        try:
+            with self.engine.connect() as conn:
+                for start in range(0, len(rows), chunksize):
+                    chunk = rows[start:start + chunksize]
+                    conn.execute(query, chunk)
+                    conn.commit()
+                    updated += len(chunk)
+        except Exception as e:
+            print(f"Error al actualizar vectores en {table_name}: {e}")
+        finally:
+            self.invalidate_query_cache(table_name)
+
+        print(f"Se actualizaron {updated} vectores en {table_name}")
+        return updated
+
     def update_by_direct_query(self, table_name, sql_query, params=None):
         """
         Ejecuta una actualización en la tabla usando una consulta SQL directa.
@@ -262,6 +415,7 @@ class DB:
                 conn.commit()
                 
                 rows_affected = result.rowcount
+                self.invalidate_query_cache(table_name)
                 print(f"Se actualizaron {rows_affected} registros en {table_name}")
                 return rows_affected > 0
                 
@@ -286,6 +440,7 @@ class DB:
                     query = text(f"DROP TABLE IF EXISTS {table_name}")
                     conn.execute(query)
                     conn.commit()
+                    self.invalidate_query_cache(table_name)
                     print(f"Tabla {table_name} eliminada exitosamente")
                     return True
                 
@@ -331,35 +486,12 @@ class DB:
         try:
             with self.engine.connect() as conn:
                 base_query = f"DELETE FROM {table_name}"
-                
-                if conditions:
-                    # Validar operador
-                    valid_operators = ['=', '!=', '<', '>', '<=', '>=', 'IS NULL', 'IS NOT NULL', 'LIKE', 'IN']
-                    operator = conditions.get('operator')
-                    
-                    if operator not in valid_operators:
-                        raise ValueError(f"Operador no válido. Debe ser uno de: {valid_operators}")
-                    
-                    # Construir WHERE según el tipo de operador
-                    if operator in ['IS NULL', 'IS NOT NULL']:
-                        where_clause = f"WHERE {conditions['column']} {operator}"
-                        query = text(f"{base_query} {where_clause}")
-                        params = {}
-                    elif operator == 'IN':
-                        where_clause = f"WHERE {conditions['column']} IN :value"
-                        query = text(f"{base_query} {where_clause}")
-                        params = {'value': tuple(conditions['value'])}
-                    else:
-                        where_clause = f"WHERE {conditions['column']} {operator} :value"
-                        query = text(f"{base_query} {where_clause}")
-                        params = {'value': conditions['value']}
-                
-                else:
-                    query = text(base_query)
-                    params = {}
+                where_clause, params = self._build_where_clause(conditions)
+                query = text(f"{base_query} {where_clause}".strip())
                 
                 result = conn.execute(query, params)
                 conn.commit()
+                self.invalidate_query_cache(table_name)
                 
                 print(f"Se eliminaron {result.rowcount} registros de {table_name}")
                 return True
@@ -396,6 +528,7 @@ class DB:
                     conn.execute(query)
                 
                 conn.commit()
+                self.invalidate_query_cache(table_name)
                 print(f"Columnas {', '.join(columns)} eliminadas exitosamente de la tabla {table_name}")
                 return True
                 
@@ -403,3 +536,78 @@ class DB:
             print(f"Error al eliminar columnas de la tabla {table_name}: {e}")
             return False
 
+    def invalidate_query_cache(self, table_name=None):
+        """
+        Elimina de la caché las consultas de una tabla, o toda la caché si table_name es None.
+        
+        Args:
+            table_name (str, optional): Nombre de la tabla a invalidar
+        """
+        with self._query_cache_lock:
+            if table_name is None:
+                self._query_cache_generation += 1
+                self._query_cache.clear()
+                return
+            self._query_cache_generations[table_name] = self._query_cache_generations.get(table_name, 0) + 1
+            for key in [k for k in self._query_cache if k[0] == table_name]:
+                del self._query_cache[key]
+
+# AUX Functions
+
+    def _build_where_clause(self, conditions):
+        """
+        Construye la cláusula WHERE y sus parámetros a partir de un diccionario de condiciones.
+        
+        Args:
+            conditions (dict, optional): {'column': ..., 'operator': ..., 'value': ...}
+        
+        Returns:
+            tuple: (where_clause (str), params (dict))
+        """
+        if not conditions:
+            return "", {}
+
+        valid_operators = ['=', '!=', '<', '>', '<=', '>=', 'IS NULL', 'IS NOT NULL', 'LIKE', 'IN']
+        operator = conditions.get('operator')
+        
+        if operator not in valid_operators:
+            raise ValueError(f"Operador no válido. Debe ser uno de: {valid_operators}")
+        
+        if operator in ['IS NULL', 'IS NOT NULL']:
+            return f"WHERE {conditions['column']} {operator}", {}
+        elif operator == 'IN':
+            return f"WHERE {conditions['column']} IN :value", {'value': tuple(conditions['value'])}
+        else:
+            return f"WHERE {conditions['column']} {operator} :value", {'value': conditions['value']}
+
+    def _query_cache_key(self, table_name, columns, conditions):
+        columns_key = tuple(columns) if columns else None
+        conditions_key = json.dumps(conditions, sort_keys=True, default=str) if conditions else None
+        return (table_name, columns_key, conditions_key)
+
+    def _get_cached_query(self, key):
+        with self._query_cache_lock:
+            entry = self._query_cache.get(key)
+            if entry is None:
+                return None
+            stored_at, df = entry
+            if self.query_cache_ttl is not None and time.monotonic() - stored_at > self.query_cache_ttl:
+                del self._query_cache[key]
+                return None
+            self._query_cache.move_to_end(key)
+            # Copia para que el llamador no modifique el DataFrame en caché
+            return df.copy()
+
+    def _query_generation(self, table_name):
+        with self._query_cache_lock:
+            return (self._query_cache_generation, self._query_cache_generations.get(table_name, 0))
+
+    def _set_cached_query(self, key, df, generation):
+        with self._query_cache_lock:
+            # Si la tabla se invalidó durante la lectura, el resultado puede estar obsoleto
+            if generation != (self._query_cache_generation, self._query_cache_generations.get(key[0], 0)):
+                return
+            self._query_cache[key] = (time.monotonic(), df.copy())
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
@@ -1,10 +1,99 @@
 from decouple import Config, RepositoryEnv
-import requests, json, os
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import pandas as pd
+import requests, json, os, shutil, tempfile, time, threading
 dotenv_path = '/home/snparada/Spacionatural/Libraries/shopify_lib/creds/.env'
 config = Config(RepositoryEnv(dotenv_path))
 
+
+class ShopifyRateLimiter:
+    """
+    Client-side mirror of Shopify's leaky bucket.
+
+    The bucket drains at `leak_rate` units per second. Each call reserves its
+    cost up front (so concurrent threads queue behind each other) and sleeps
+    only when the bucket would overflow. Every response re-syncs the level
+    with what Shopify reports, so pacing converges on the real limit.
+    """
+
+    # Limiters are shared by every client pointing at the same shop, since
+    # Shopify keeps a single bucket per app and store.
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, shop_url, kind, **kwargs):
+        """Return the limiter of `kind` ('rest' or 'graphql') for a shop, creating it once."""
+        key = (shop_url, kind)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(**kwargs)
+            return cls._shared[key]
+
+    def __init__(self, capacity=40, leak_rate=2.0, safety_margin=2):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.safety_margin = safety_margin
+        self.level = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, cost=1):
+        """Reserve `cost` units and return the seconds to wait before sending."""
+        with self.lock:
+            self._leak()
+            overflow = self.level + cost - (self.capacity - self.safety_margin)
+            self.level += cost
+            return max(0.0, overflow / self.leak_rate)
+
+    def acquire(self, cost=1):
+        wait = self.reserve(cost)
+        if wait > 0:
+            time.sleep(wait)
+
+    def update(self, level, capacity=None, leak_rate=None):
+        """Sync the bucket with the level reported by Shopify."""
+        with self.lock:
+            if capacity:
+                self.capacity = capacity
+            if leak_rate:
+                self.leak_rate = leak_rate
+            self.level = float(level)
+            self.updated_at = time.monotonic()
+
+    def update_from_call_limit(self, call_limit):
+        # Header format: "32/40" (used/capacity). The bucket leaks capacity/20
+        # calls per second: 2/s on standard plans, 20/s on Plus.
+        if not call_limit:
+            return
+        try:
+            used, capacity = (int(part) for part in call_limit.split('/'))
+        except ValueError:
+            return
+        self.update(used, capacity=capacity, leak_rate=capacity / 20)
+
+    def update_from_throttle_status(self, throttle_status):
+        # GraphQL reports extensions.cost.throttleStatus in the response body
+        if not throttle_status:
+            return
+        self.update(
+            throttle_status['maximumAvailable'] - throttle_status['currentlyAvailable'],
+            capacity=throttle_status['maximumAvailable'],
+            leak_rate=throttle_status['restoreRate']
+        )
+
+    def _leak(self):
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.updated_at) * self.leak_rate)
+        self.updated_at = now
+
+
 class ShopifyAPI:
-    def __init__(self, shop_url=None, api_password=None, api_version="2025-01"):
+    def __init__(self, shop_url=None, api_password=None, api_version="2025-01", pool_size=10, max_retries=5, backoff_factor=1, timeout=30):
         # Leer las variables de entorno utilizando decouple
         self.shop_url = shop_url if shop_url else config('SHOPIFY_SHOP_URL')
         self.api_password = api_password if api_password else config('SHOPIFY_PASSWORD')
@@ -17,7 +106,36 @@ class ShopifyAPI:
         # Asegúrate de que la base_url termine con una barra
         if not self.base_url.endswith('/'):
             self.base_url += '/'
-        
+
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.session = self._create_session(pool_size)
+        self.rest_limiter = ShopifyRateLimiter.shared(self.shop_url, 'rest', capacity=40, leak_rate=2.0)
+        self.graphql_limiter = ShopifyRateLimiter.shared(self.shop_url, 'graphql', capacity=1000, leak_rate=50.0, safety_margin=50)
+        self.graphql_url = urljoin(self.base_url, 'graphql.json')
+
+    def _create_session(self, pool_size):
+        """
+        Build a pooled keep-alive session that retries 429/5xx with backoff.
+
+        Idempotent methods are retried by urllib3 (honoring Retry-After).
+        POST is excluded there so a 5xx never duplicates a create; a 429 on
+        POST is retried in `request`, since Shopify did not process it.
+        """
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(['GET', 'PUT', 'DELETE', 'HEAD', 'OPTIONS']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
 
     def get_headers(self):
         return {
@@ -25,11 +143,81 @@ class ShopifyAPI:
             'X-Shopify-Access-Token': self.api_password
         }
 
+    def request(self, method, endpoint, **kwargs):
+        """
+        Send a request through the shared session.
+
+        Args:
+            method (str): HTTP method
+            endpoint (str): API endpoint relative to base_url, or an absolute URL
+            **kwargs: Additional arguments to pass to requests.Session.request
+
+        Returns:
+            requests.Response: The raw response (status is not checked)
+        """
+        url = urljoin(self.base_url, endpoint)
+        headers = {**self.get_headers(), **kwargs.pop('headers', {})}
+        kwargs.setdefault('timeout', self.timeout)
+        # GraphQL is paced by query cost in `graphql`, not by call count
+        is_rest = url != self.graphql_url
+
+        for attempt in range(self.max_retries + 1):
+            if is_rest:
+                self.rest_limiter.acquire()
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            if is_rest:
+                self.rest_limiter.update_from_call_limit(response.headers.get('X-Shopify-Shop-Api-Call-Limit'))
+            if response.status_code != 429 or method.upper() != 'POST' or attempt == self.max_retries:
+                break
+            time.sleep(self._retry_after(response, attempt))
+
+        self.last_response = response
+        return response
+
+    def graphql(self, query, variables=None, estimated_cost=50):
+        """
+        Run a GraphQL Admin API query paced by its calculated cost.
+
+        Args:
+            query (str): GraphQL query or mutation
+            variables (dict, optional): Query variables
+            estimated_cost (int): Points reserved before the query is sent;
+                the bucket is re-synced with the real cost afterwards
+
+        Returns:
+            dict: The `data` member of the response
+
+        Raises:
+            Exception: If the response contains errors other than throttling
+        """
+        payload = {'query': query, 'variables': variables or {}}
+
+        for attempt in range(self.max_retries + 1):
+            self.graphql_limiter.acquire(estimated_cost)
+            response = self.request('POST', self.graphql_url, json=payload)
+            response.raise_for_status()
+            result = response.json()
+
+            cost = result.get('extensions', {}).get('cost', {})
+            throttle_status = cost.get('throttleStatus')
+            self.graphql_limiter.update_from_throttle_status(throttle_status)
+
+            errors = result.get('errors')
+            if not errors:
+                return result.get('data')
+
+            throttled = any(e.get('extensions', {}).get('code') == 'THROTTLED' for e in errors)
+            if not throttled or attempt == self.max_retries:
+                raise Exception(f"GraphQL errors: {errors}")
+
+            # Wait until the bucket has room for the query that was rejected
+            missing = cost.get('requestedQueryCost', estimated_cost) - (throttle_status or {}).get('currentlyAvailable', 0)
+            restore_rate = (throttle_status or {}).get('restoreRate', self.graphql_limiter.leak_rate)
+            time.sleep(max(missing / restore_rate, self.backoff_factor))
+
     # Método para leer datos de la tienda Shopify via API
     def read(self, resource, params={}):
-        url = f"{self.base_url}/{resource}"
-        response = requests.get(url, headers=self.get_headers(), params=params)
-        self.last_response = response
+        response = self.request('GET', resource, params=params)
         response.raise_for_status()
         return response.json()
 
@@ -44,9 +232,7 @@ class ShopifyAPI:
         Returns:
             dict: JSON response from the API
         """
-        url = f"{self.base_url}/{endpoint}"
-        response = requests.put(url, headers=self.get_headers(), **kwargs)
-        self.last_response = response
+        response = self.request('PUT', endpoint, **kwargs)
         response.raise_for_status()
         return response.json()
 
@@ -61,9 +247,7 @@ class ShopifyAPI:
         Returns:
             dict: JSON response from the API
         """
-        url = f"{self.base_url}/{endpoint}"
-        response = requests.post(url, headers=self.get_headers(), **kwargs)
-        self.last_response = response
+        response = self.request('POST', endpoint, **kwargs)
         response.raise_for_status()
         return response.json()
 
@@ -78,8 +262,423 @@ class ShopifyAPI:
         Returns:
             dict: JSON response from the API
         """
-        url = f"{self.base_url}/{endpoint}"
-        response = requests.delete(url, headers=self.get_headers(), **kwargs)
-        self.last_response = response
+        response = self.request('DELETE', endpoint, **kwargs)
         response.raise_for_status()
-        return response.json() if response.text else None
\ No newline at end of file
+        return response.json() if response.text else None
+
+    def iter_pages(self, endpoint, key, params=None, fields=None, limit=250, prefetch=True):
+        """
+        Iterate over a paginated REST resource one page at a time.
+
+        Follows the cursor in the Link header. With `prefetch`, the next page is
+        requested in the background while the caller works on the current one.
+
+        Args:
+            endpoint (str): Resource endpoint (e.g. 'products.json')
+            key (str): Key of the record list in the response (e.g. 'products')
+            params (dict, optional): Filters for the first request
+            fields (list, optional): Only return these fields, to shrink payloads
+            limit (int): Records per page (Shopify allows up to 250)
+            prefetch (bool): Fetch the next page while the current one is consumed
+
+        Yields:
+            list: The records of each page
+
+        Raises:
+            requests.HTTPError: If any page cannot be read, so a partial listing
+                is never mistaken for a complete one
+        """
+        params = {**(params or {}), 'limit': limit}
+        if fields:
+            params['fields'] = ','.join(fields)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = self._read_page(endpoint, key, params)
+            while page is not None:
+                records, next_url = page
+                future = executor.submit(self._read_page, next_url, key) if executor and next_url else None
+                yield records
+                if future:
+                    page = future.result()
+                elif next_url:
+                    page = self._read_page(next_url, key)
+                else:
+                    page = None
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
+
+    def iter_records(self, endpoint, key, params=None, fields=None, limit=250, prefetch=True):
+        """Same as iter_pages, but yields one record at a time."""
+        for records in self.iter_pages(endpoint, key, params, fields, limit, prefetch):
+            yield from records
+
+    def _read_page(self, endpoint, key, params=None):
+        # Returns (records, next_url). Errors raise, so callers never get a silently truncated listing
+        response = self.request('GET', endpoint, params=params)
+        if response.status_code != 200:
+            print(f"Error al obtener {key}: {response.status_code}, {response.text}")
+            response.raise_for_status()
+            raise requests.HTTPError(f"Unexpected status {response.status_code} reading {key}", response=response)
+        if not response.content:
+            return [], None
+        next_link = response.links.get('next')
+        return response.json().get(key, []), next_link['url'] if next_link else None
+
+    def read_metafields_bulk(self, owner_type, owner_ids, namespace=None, owners_per_query=25, metafields_per_owner=25, max_workers=4):
+        """
+        Read the metafields of many owners with batched GraphQL `nodes(ids:)` queries.
+
+        Batches run on a small thread pool; the shared GraphQL limiter keeps
+        them within the cost budget. Owners with more than
+        `metafields_per_owner` metafields are completed through REST.
+
+        Args:
+            owner_type (str): GraphQL type of the owners ('Product', 'Customer', ...)
+            owner_ids (list): Numeric IDs or GIDs of the owners
+            namespace (str, optional): Only read this namespace
+            owners_per_query (int): Owners per GraphQL query
+            metafields_per_owner (int): Metafields requested per owner
+            max_workers (int): Concurrent queries
+
+        Returns:
+            pandas.DataFrame: owner_id, metafield_id, namespace, key, value, type
+        """
+        query = """
+        query metafieldsByOwner($ids: [ID!]!, $first: Int!, $namespace: String) {
+            nodes(ids: $ids) {
+                id
+                ... on HasMetafields {
+                    metafields(first: $first, namespace: $namespace) {
+                        pageInfo { hasNextPage }
+                        nodes { id namespace key value type }
+                    }
+                }
+            }
+        }
+        """
+        gids = [self.to_gid(owner_type, owner_id) for owner_id in owner_ids]
+        batches = [gids[start:start + owners_per_query] for start in range(0, len(gids), owners_per_query)]
+        # Connection cost is roughly 2 + first per owner
+        estimated_cost = owners_per_query * (metafields_per_owner + 2)
+
+        def read_batch(batch):
+            variables = {'ids': batch, 'first': metafields_per_owner, 'namespace': namespace}
+            return self.graphql(query, variables, estimated_cost=estimated_cost)['nodes']
+
+        rows, truncated = [], []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for nodes in executor.map(read_batch, batches):
+                for node in nodes:
+                    if not node or 'metafields' not in node:
+                        continue
+                    owner_id = self.from_gid(node['id'])
+                    if node['metafields']['pageInfo']['hasNextPage']:
+                        truncated.append(owner_id)
+                        continue
+                    for metafield in node['metafields']['nodes']:
+                        rows.append({
+                            'owner_id': owner_id,
+                            'metafield_id': self.from_gid(metafield['id']),
+                            'namespace': metafield['namespace'],
+                            'key': metafield['key'],
+                            'value': metafield['value'],
+                            'type': metafield['type']
+                        })
+
+        resource = {'Product': 'products', 'Customer': 'customers', 'Collection': 'collections',
+                    'ProductVariant': 'variants', 'Order': 'orders'}.get(owner_type)
+        for owner_id in truncated:
+            params = {'namespace': namespace} if namespace else None
+            for metafield in self.iter_records(f"{resource}/{owner_id}/metafields.json", 'metafields', params=params):
+                rows.append({
+                    'owner_id': owner_id,
+                    'metafield_id': metafield['id'],
+                    'namespace': metafield['namespace'],
+                    'key': metafield['key'],
+                    'value': metafield['value'],
+                    'type': metafield.get('type')
+                })
+
+        return pd.DataFrame(rows, columns=['owner_id', 'metafield_id', 'namespace', 'key', 'value', 'type'])
+
+    def run_bulk_query(self, query, poll_interval=2, max_poll_interval=30, timeout=None):
+        """
+        Run a query as a Bulk Operation and wait for it to finish.
+
+        Args:
+            query (str): GraphQL query to export (must use connections with edges/node)
+            poll_interval (float): Initial seconds between status checks
+            max_poll_interval (float): Upper bound for the polling backoff
+            timeout (float, optional): Give up after this many seconds
+
+        Returns:
+            str: URL of the JSONL result, or None if the query matched nothing
+        """
+        mutation = """
+        mutation bulkOperationRunQuery($query: String!) {
+            bulkOperationRunQuery(query: $query) {
+                bulkOperation { id status }
+                userErrors { field message }
+            }
+        }
+        """
+        data = self.graphql(mutation, {'query': query}, estimated_cost=10)
+        result = data['bulkOperationRunQuery']
+        if result['userErrors']:
+            raise Exception(f"Bulk operation could not start: {result['userErrors']}")
+        operation_id = result['bulkOperation']['id']
+
+        status_query = """
+        query bulkOperationStatus($id: ID!) {
+            node(id: $id) {
+                ... on BulkOperation { id status errorCode objectCount url partialDataUrl }
+            }
+        }
+        """
+        started_at = time.monotonic()
+        while True:
+            operation = self.graphql(status_query, {'id': operation_id}, estimated_cost=1)['node']
+            status = operation['status']
+            if status == 'COMPLETED':
+                print(f"Bulk operation {operation_id} completed with {operation['objectCount']} objects")
+                return operation['url']
+            if status in ('FAILED', 'CANCELED', 'EXPIRED'):
+                raise Exception(f"Bulk operation {operation_id} ended with status {status}: {operation['errorCode']}")
+            if timeout and time.monotonic() - started_at > timeout:
+                raise TimeoutError(f"Bulk operation {operation_id} still {status} after {timeout}s")
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, max_poll_interval)
+
+    def iter_bulk_results(self, url):
+        """
+        Stream the JSONL result of a Bulk Operation one record at a time.
+
+        Args:
+            url (str): Result URL returned by run_bulk_query
+
+        Yields:
+            dict: One record per line
+        """
+        if not url:
+            return
+        # The result lives on Shopify's storage, so no access token is sent
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def iter_bulk_dataframes(self, url, chunk_size=10000):
+        """
+        Stream the JSONL result of a Bulk Operation as DataFrames of `chunk_size` rows.
+        Nested objects are flattened with '_' (e.g. product_title).
+        """
+        chunk = []
+        for record in self.iter_bulk_results(url):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield pd.json_normalize(chunk, sep='_')
+                chunk = []
+        if chunk:
+            yield pd.json_normalize(chunk, sep='_')
+
+    def bulk_export(self, query, path=None, chunk_size=10000, **kwargs):
+        """
+        Export a query with a Bulk Operation.
+
+        Args:
+            query (str): GraphQL bulk query
+            path (str, optional): If given, rows are written to this Parquet file
+                chunk by chunk (requires pyarrow) and the path is returned
+            chunk_size (int): Rows per DataFrame/Parquet row group
+            **kwargs: Passed to run_bulk_query (poll_interval, timeout, ...)
+
+        Returns:
+            pandas.DataFrame or str: The exported rows, or the Parquet path
+        """
+        url = self.run_bulk_query(query, **kwargs)
+        chunks = self.iter_bulk_dataframes(url, chunk_size)
+
+        if path is None:
+            frames = list(chunks)
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required to export to Parquet: pip install pyarrow")
+
+        # Columns can appear or change type in later chunks (json_normalize yields
+        # 'customer' or 'customer_id' depending on nulls), so each chunk is staged
+        # with its own schema and the file is written once the schema is known
+        parts_dir = tempfile.mkdtemp(prefix='bulk_export_', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            parts = []
+            for df in chunks:
+                part_path = os.path.join(parts_dir, f"part-{len(parts):05d}.parquet")
+                pq.write_table(self._arrow_table(df), part_path)
+                parts.append(part_path)
+
+            if not parts:
+                print("Bulk operation returned no rows; no file was written")
+                return path
+
+            schema, as_json = self._merge_parquet_schemas([pq.read_schema(part) for part in parts])
+            with pq.ParquetWriter(path, schema) as writer:
+                for part in parts:
+                    writer.write_table(self._conform_table(pq.read_table(part), schema, as_json))
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+        return path
+
+    def _arrow_table(self, df):
+        import pyarrow as pa
+
+        try:
+            return pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed values inside one column: keep that column as JSON text
+            df = df.copy()
+            for column in df.columns[df.dtypes == object]:
+                try:
+                    pa.array(df[column], from_pandas=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    print(f"Column {column} has mixed types; stored as JSON text")
+                    df[column] = [None if value is None else json.dumps(value, default=str) for value in df[column]]
+            return pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+
+    def _merge_parquet_schemas(self, schemas):
+        # Union of every chunk's columns, in first-seen order. Null types are widened to the
+        # type seen later; columns whose types can't be reconciled are stored as JSON text
+        import pyarrow as pa
+
+        types, first_schema = {}, schemas[0].names
+        as_json = set()
+        for schema in schemas:
+            for field in schema:
+                current = types.get(field.name)
+                if current is None or pa.types.is_null(current):
+                    types[field.name] = field.type
+                elif not pa.types.is_null(field.type) and field.type != current and field.name not in as_json:
+                    try:
+                        types[field.name] = pa.unify_schemas(
+                            [pa.schema([(field.name, current)]), pa.schema([(field.name, field.type)])],
+                            promote_options='permissive'
+                        ).field(field.name).type
+                    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+                        as_json.add(field.name)
+
+        added = [name for name in types if name not in first_schema]
+        if added:
+            print(f"Columns first seen after the first chunk were added: {added}")
+        if as_json:
+            print(f"Columns with conflicting types are stored as JSON text: {sorted(as_json)}")
+
+        fields = []
+        for name, column_type in types.items():
+            if name in as_json or pa.types.is_null(column_type):
+                column_type = pa.string()
+            fields.append(pa.field(name, column_type))
+        return pa.schema(fields), as_json
+
+    def _conform_table(self, table, schema, as_json):
+        import pyarrow as pa
+
+        columns = []
+        for field in schema:
+            if field.name not in table.column_names:
+                columns.append(pa.nulls(table.num_rows, field.type))
+                continue
+            column = table.column(field.name)
+            if field.name in as_json and not pa.types.is_string(column.type):
+                values = [None if value is None else json.dumps(value, default=str) for value in column.to_pylist()]
+                columns.append(pa.array(values, pa.string()))
+            else:
+                columns.append(column.cast(field.type))
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    def to_gid(self, resource, resource_id):
+        """Return the GraphQL global ID for a REST numeric ID (IDs that already are GIDs pass through)."""
+        resource_id = str(resource_id)
+        if resource_id.startswith('gid://'):
+            return resource_id
+        return f"gid://shopify/{resource}/{resource_id}"
+
+    def from_gid(self, gid):
+        """Return the numeric REST ID of a GraphQL global ID."""
+        return int(str(gid).rsplit('/', 1)[-1].split('?')[0])
+
+    def _typed_dataframe(self, df, datetime_columns=(), int_columns=(), decimal_columns=(), bool_columns=(), category_columns=()):
+        """
+        Cast the string columns of a REST payload to proper dtypes: UTC datetimes,
+        nullable Int64, decimals (Arrow decimal128 when pyarrow is available,
+        Float64 otherwise), nullable booleans and categories.
+        """
+        decimal_dtype = self._decimal_dtype()
+        for column in datetime_columns:
+            df[column] = pd.to_datetime(df[column], utc=True, errors='coerce')
+        for column in int_columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('Int64')
+        for column in decimal_columns:
+            if decimal_dtype == 'Float64':
+                df[column] = pd.to_numeric(df[column], errors='coerce').astype('Float64')
+            else:
+                values = [Decimal(str(value)) if pd.notna(value) and value != '' else None for value in df[column]]
+                df[column] = pd.array(values, dtype=decimal_dtype)
+        for column in bool_columns:
+            df[column] = df[column].astype('boolean')
+        for column in category_columns:
+            df[column] = df[column].astype('category')
+        return df
+
+    def _decimal_dtype(self):
+        try:
+            import pyarrow as pa
+            return pd.ArrowDtype(pa.decimal128(18, 4))
+        except (ImportError, AttributeError):
+            return 'Float64'
+
+    def _map_user_errors(self, user_errors, list_field, size):
+        """
+        Map GraphQL userErrors to positions of the input list they refer to.
+        Errors that do not point at an element apply to every position.
+
+        Returns:
+            dict: position -> error message
+        """
+        errors = {}
+        for user_error in user_errors:
+            field = user_error.get('field') or []
+            position = None
+            if list_field in field:
+                after = field[field.index(list_field) + 1:]
+                if after and str(after[0]).isdigit():
+                    position = int(after[0])
+            targets = [position] if position is not None and position < size else range(size)
+            for target in targets:
+                errors[target] = f"{errors[target]}; {user_error['message']}" if target in errors else user_error['message']
+        return errors
+
+    def _load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _save_checkpoint(self, path, checkpoint):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(checkpoint, file)
+        os.replace(tmp_path, path)
+
+    def _retry_after(self, response, attempt):
+        retry_after = response.headers.get('Retry-After')
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return self.backoff_factor * (2 ** attempt)
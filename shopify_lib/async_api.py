@@ -0,0 +1,214 @@
+import sys
+import asyncio
+import importlib.util
+import httpx
+sys.path.append('/home/snparada/Spacionatural/Libraries/')
+# Same import path as the sync clients, so the limiter registry is shared
+from shopify_lib.api import ShopifyRateLimiter, config
+
+
+class AsyncShopifyAPI:
+    """
+    asyncio client for webhook-driven workloads.
+
+    Uses one pooled httpx.AsyncClient and the same per-shop leaky buckets as
+    ShopifyAPI, so many concurrent coroutines share the call budget safely,
+    also with sync clients (products, orders, ...) in the same process.
+    That relies on every module importing `shopify_lib.api`, never plain
+    `api`, so ShopifyRateLimiter has a single registry.
+    Use it as an async context manager, or call `close()` when done.
+    """
+
+    def __init__(self, shop_url=None, api_password=None, api_version="2025-01", pool_size=100, max_retries=5, backoff_factor=1, timeout=30):
+        self.shop_url = (shop_url if shop_url else config('SHOPIFY_SHOP_URL')).rstrip('/')
+        self.api_password = api_password if api_password else config('SHOPIFY_PASSWORD')
+        self.api_version = api_version if api_version else config('SHOPIFY_API_VERSION')
+        self.base_url = f"{self.shop_url}/admin/api/{self.api_version}/"
+        self.graphql_url = f"{self.base_url}graphql.json"
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.get_headers(),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout,
+            # HTTP/2 multiplexes the concurrent requests when h2 is installed
+            http2=importlib.util.find_spec('h2') is not None
+        )
+        self.rest_limiter = ShopifyRateLimiter.shared(self.shop_url, 'rest', capacity=40, leak_rate=2.0)
+        self.graphql_limiter = ShopifyRateLimiter.shared(self.shop_url, 'graphql', capacity=1000, leak_rate=50.0, safety_margin=50)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    def get_headers(self):
+        return {
+            'Content-Type': 'application/json',
+            'X-Shopify-Access-Token': self.api_password
+        }
+
+    async def request(self, method, endpoint, **kwargs):
+        """
+        Send a request through the shared client, paced by the REST bucket.
+        Retries 429 (any method) and 5xx (except POST) with backoff, honoring Retry-After.
+
+        Returns:
+            httpx.Response: The raw response (status is not checked)
+        """
+        is_rest = endpoint != 'graphql.json'
+        for attempt in range(self.max_retries + 1):
+            if is_rest:
+                wait = self.rest_limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            response = await self.client.request(method, endpoint, **kwargs)
+            if is_rest:
+                self.rest_limiter.update_from_call_limit(response.headers.get('X-Shopify-Shop-Api-Call-Limit'))
+
+            retryable = response.status_code == 429 or (response.status_code >= 500 and method.upper() != 'POST')
+            if not retryable or attempt == self.max_retries:
+                return response
+            await asyncio.sleep(self._retry_after(response, attempt))
+
+    async def read(self, resource, params=None):
+        response = await self.request('GET', resource, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def put(self, endpoint, **kwargs):
+        response = await self.request('PUT', endpoint, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def post(self, endpoint, **kwargs):
+        response = await self.request('POST', endpoint, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def delete(self, endpoint, **kwargs):
+        response = await self.request('DELETE', endpoint, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.text else None
+
+    async def graphql(self, query, variables=None, estimated_cost=50):
+        """Async version of ShopifyAPI.graphql."""
+        payload = {'query': query, 'variables': variables or {}}
+
+        for attempt in range(self.max_retries + 1):
+            wait = self.graphql_limiter.reserve(estimated_cost)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            response = await self.request('POST', 'graphql.json', json=payload)
+            response.raise_for_status()
+            result = response.json()
+
+            cost = result.get('extensions', {}).get('cost', {})
+            throttle_status = cost.get('throttleStatus')
+            self.graphql_limiter.update_from_throttle_status(throttle_status)
+
+            errors = result.get('errors')
+            if not errors:
+                return result.get('data')
+
+            throttled = any(e.get('extensions', {}).get('code') == 'THROTTLED' for e in errors)
+            if not throttled or attempt == self.max_retries:
+                raise Exception(f"GraphQL errors: {errors}")
+
+            missing = cost.get('requestedQueryCost', estimated_cost) - (throttle_status or {}).get('currentlyAvailable', 0)
+            restore_rate = (throttle_status or {}).get('restoreRate', self.graphql_limiter.leak_rate)
+            await asyncio.sleep(max(missing / restore_rate, self.backoff_factor))
+
+#--------------------ORDERS--------------------
+
+    async def read_order_by_number(self, order_number):
+        """
+        Retrieve an order by its order number (name), as ShopifyOrders.read_order_by_number.
+        """
+        order_number = str(order_number).replace('#', '')
+        order_number = order_number.lower().replace('sn', '').replace('-', '').replace(' ', '')
+
+        data = await self.read('orders.json', params={'name': order_number, 'status': 'any'})
+        return data['orders'][0] if data['orders'] else None
+
+    async def read_order_by_id(self, order_id):
+        data = await self.read(f'orders/{order_id}.json')
+        return data.get('order')
+
+    async def read_draft_order_by_id(self, draft_id):
+        data = await self.read(f'draft_orders/{draft_id}.json')
+        return data.get('draft_order')
+
+    async def create_new_draft_order(self, products, email):
+        """
+        Create a new draft order for a customer, as ShopifyOrders.create_new_draft_order.
+
+        Returns:
+            tuple: (draft_order_id, payment_url) or (None, None) if error
+        """
+        draft_order_data = {
+            'draft_order': {
+                'email': email,
+                'line_items': products,
+                'send_email_invite': False
+            }
+        }
+        try:
+            response = await self.post('draft_orders.json', json=draft_order_data)
+            draft_order = response['draft_order']
+            return draft_order['id'], draft_order.get('invoice_url')
+        except Exception as e:
+            print(f"Error creating draft order: {e}")
+            return None, None
+
+#--------------------PRODUCTS--------------------
+
+    async def read_product(self, product_id, fields=None):
+        params = {'fields': ','.join(fields)} if fields else None
+        data = await self.read(f'products/{product_id}.json', params=params)
+        return data.get('product')
+
+    async def read_variant(self, variant_id):
+        data = await self.read(f'variants/{variant_id}.json')
+        return data.get('variant')
+
+    async def read_variant_by_sku(self, sku):
+        query = """
+        query variantBySku($query: String!) {
+            productVariants(first: 10, query: $query) {
+                nodes { id sku price inventoryQuantity product { id } inventoryItem { id } }
+            }
+        }
+        """
+        search = 'sku:"{}"'.format(sku.replace('"', '\\"'))
+        data = await self.graphql(query, {'query': search}, estimated_cost=15)
+        return next((node for node in data['productVariants']['nodes'] if node['sku'] == sku), None)
+
+#--------------------CUSTOMERS--------------------
+
+    async def read_customer(self, customer_id):
+        data = await self.read(f'customers/{customer_id}.json')
+        return data.get('customer')
+
+    async def read_customer_by_email(self, email):
+        data = await self.read('customers/search.json', params={'query': f'email:{email}'})
+        return data['customers'][0] if data['customers'] else None
+
+    async def update_customer(self, customer_id, update_data):
+        data = await self.put(f'customers/{customer_id}.json', json={'customer': update_data})
+        return data.get('customer')
+
+# ----------------------AUX FUNCTIONS ----------------------
+
+    def _retry_after(self, response, attempt):
+        retry_after = response.headers.get('Retry-After')
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return self.backoff_factor * (2 ** attempt)
@@ -1,13 +1,13 @@
 import sys
-sys.path.append('/home/snparada/Spacionatural/Libraries/shopify_lib')
-from api import ShopifyAPI
-import requests, json
-from urllib.parse import urljoin, urlparse
+sys.path.append('/home/snparada/Spacionatural/Libraries/')
+from shopify_lib.api import ShopifyAPI
+import json
+from urllib.parse import urljoin
 import pandas as pd
 
 class ShopifyBlogs(ShopifyAPI):
-    def __init__(self, shop_url=None, api_password=None, api_version="2024-01"):
-        super().__init__(shop_url, api_password, api_version)
+    def __init__(self, shop_url=None, api_password=None, api_version="2024-01", **kwargs):
+        super().__init__(shop_url, api_password, api_version, **kwargs)
 
     def read_all_blogs(self):
         """
@@ -15,7 +15,7 @@ class ShopifyBlogs(ShopifyAPI):
         """
         endpoint = 'blogs.json'
         full_url = urljoin(self.base_url, endpoint)
-        response = requests.get(full_url, headers=self.get_headers())
+        response = self.request('GET', full_url)
         
         if response.status_code == 200 and response.content:
             data = json.loads(response.content)
@@ -26,29 +26,19 @@ class ShopifyBlogs(ShopifyAPI):
 
 
     # Método para obtener todos los posts del blog
-    def read_all_blog_posts(self, blog_id):
-        posts = []
-        endpoint = f'blogs/{blog_id}/articles.json?limit=250'
-        while endpoint:
-            full_url = urljoin(self.base_url, endpoint)
-            response = requests.get(full_url, headers=self.get_headers())
+    def read_all_blog_posts(self, blog_id, fields=None):
+        return list(self.iter_blog_posts(blog_id, fields=fields))
 
-            if response.status_code == 200 and response.content:
-                data = json.loads(response.content)
-                posts.extend(data['articles'])
-
-                next_link = response.links.get('next')
-                if next_link:
-                    next_url = next_link['url']
-                    parsed_url = urlparse(next_url)
-                    endpoint = parsed_url.path + "?" + parsed_url.query
-                else:
-                    endpoint = None
-            else:
-                print(f"Error al obtener posts del blog: {response.status_code}, {response.text}")
-                break
+    def iter_blog_posts(self, blog_id, fields=None, params=None):
+        """
+        Itera los posts de un blog uno a uno, sin cargarlos todos en memoria.
 
-        return posts
+        Args:
+            blog_id (int): ID del blog
+            fields (list, optional): Solo devolver estos campos
+            params (dict, optional): Filtros adicionales
+        """
+        return self.iter_records(f'blogs/{blog_id}/articles.json', 'articles', params=params, fields=fields)
 
     def read_all_blog_posts_df(self, blog_id):
         """
@@ -59,7 +49,7 @@ class ShopifyBlogs(ShopifyAPI):
         all_posts = []
         
         try:
-            response = requests.get(full_url, headers=self.get_headers())
+            response = self.request('GET', full_url)
             
             if response.status_code == 200 and response.content:
                 data = json.loads(response.content)
@@ -103,7 +93,7 @@ class ShopifyBlogs(ShopifyAPI):
                 "tags": ", ".join(new_tags)
             }
         }
-        response = requests.put(update_url, json=data, headers=self.get_headers())
+        response = self.request('PUT', update_url, json=data)
         if response.status_code == 200:
             print(f"Tags actualizados para el post {post_id}")
         else:
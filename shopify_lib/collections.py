@@ -1,37 +1,28 @@
 import sys
-sys.path.append('/home/snparada/Spacionatural/Libraries/shopify_lib')
-from api import ShopifyAPI
-import requests, json, time
-from urllib.parse import urljoin, urlparse
+sys.path.append('/home/snparada/Spacionatural/Libraries/')
+from shopify_lib.api import ShopifyAPI
+from shopify_lib.image_store import ShopifyImageStore
+from urllib.parse import urljoin
+import time
+from datetime import datetime
 
 class ShopifyCollections(ShopifyAPI):
-    def __init__(self, shop_url=None, api_password=None, api_version="2024-01"):
-        super().__init__(shop_url, api_password, api_version)
+    def __init__(self, shop_url=None, api_password=None, api_version="2024-01", **kwargs):
+        super().__init__(shop_url, api_password, api_version, **kwargs)
 
 # CRUD      
-    def read_all_collections(self):       
-        collections = []
-        endpoint = 'custom_collections.json?limit=250'
-        while endpoint:
-            full_url = urljoin(self.base_url, endpoint)
-            response = requests.get(full_url, headers=self.get_headers())
-
-            if response.status_code == 200 and response.content:
-                data = json.loads(response.content)
-                collections.extend(data['custom_collections'])
-
-                next_link = response.links.get('next')
-                if next_link:
-                    next_url = next_link['url']
-                    parsed_url = urlparse(next_url)
-                    endpoint = parsed_url.path + "?" + parsed_url.query
-                else:
-                    endpoint = None
-            else:
-                print(f"Error al obtener productos: {response.status_code}, {response.text}")
-                break
+    def read_all_collections(self, fields=None):
+        return list(self.iter_collections(fields=fields))
+
+    def iter_collections(self, fields=None, params=None):
+        """
+        Yield custom collections one at a time.
 
-        return collections
+        Args:
+            fields (list, optional): Only return these collection fields
+            params (dict, optional): Extra filters
+        """
+        return self.iter_records('custom_collections.json', 'custom_collections', params=params, fields=fields)
 
     def read_all_images(self):
         images = []
@@ -46,9 +37,46 @@ class ShopifyCollections(ShopifyAPI):
                 continue
         return images
 
+    def sync_images(self, store_dir, max_workers=8):
+        """
+        Mirror collection images into a local content-addressed store.
+        Same behaviour as ShopifyProducts.sync_images.
+
+        Returns:
+            list: Image dicts (as in read_all_images) plus 'sha256' and 'local_path'
+        """
+        store = ShopifyImageStore(store_dir, session=self.session)
+        synced_at = store.synced_at('collections')
+        params = {'updated_at_min': synced_at} if synced_at else None
+
+        # Pages come in id order, not updated_at order: the watermark only moves after
+        # every page was read. On failure the images gathered so far are still stored.
+        try:
+            for collection in self.iter_collections(fields=['id', 'body_html', 'image', 'updated_at'], params=params):
+                image = collection.get('image')
+                images = [{
+                    'key': f"collection:{collection['id']}",
+                    'collection_id': collection['id'],
+                    'src': image['src'],
+                    'alt': image.get('alt'),
+                    'updated_at': image.get('created_at') or collection['updated_at'],
+                    'description': collection['body_html']
+                }] if image else []
+                store.update_owner_images('collections', collection['id'], images)
+                if not synced_at or datetime.fromisoformat(collection['updated_at']) > datetime.fromisoformat(synced_at):
+                    synced_at = collection['updated_at']
+        except Exception:
+            store.download(max_workers)
+            store.save()
+            raise
+
+        store.download(max_workers)
+        store.save('collections', synced_at)
+        return store.images('collections')
+
     def read_collection_id(self, collection_handle):
         url = urljoin(self.base_url, f"custom_collections.json?handle={collection_handle}")
-        response = requests.get(url, headers=self.get_headers())
+        response = self.request('GET', url)
         if response.status_code == 200:
             collections = response.json().get('custom_collections', [])
             if collections:
@@ -65,12 +93,69 @@ class ShopifyCollections(ShopifyAPI):
                 }
             }
         }
-        response = requests.put(update_url, json=data, headers=self.get_headers())
+        response = self.request('PUT', update_url, json=data)
         if response.status_code == 200:
             print(f"{collection_id}'s image was updated")
         else:
             print(f"{collection_id}'s image updating was failed")
 
+    def update_images_seo_bulk(self, df, collection_column='collection_id', alt_column='alt',
+                               checkpoint_path=None, collections_per_request=25):
+        """
+        Update collection image alt texts with aliased collectionUpdate mutations.
+
+        Args:
+            df (pandas.DataFrame): One row per collection with the new alt
+            collection_column, alt_column (str): Column names
+            checkpoint_path (str, optional): JSON file with the collections already done
+            collections_per_request (int): Collections per GraphQL call
+
+        Returns:
+            pandas.DataFrame: Input rows plus 'status' ('updated', 'skipped', 'error') and 'error' columns
+        """
+        results = df.copy()
+        results['status'] = None
+        results['error'] = None
+
+        checkpoint = (self._load_checkpoint(checkpoint_path) if checkpoint_path else None) or {'done': []}
+        done = set(checkpoint['done'])
+
+        pending = []
+        for index, row in results.iterrows():
+            if int(row[collection_column]) in done:
+                results.at[index, 'status'] = 'skipped'
+            else:
+                pending.append((index, int(row[collection_column]), row[alt_column]))
+
+        for start in range(0, len(pending), collections_per_request):
+            chunk = pending[start:start + collections_per_request]
+            definitions, fields, variables = [], [], {}
+            for i, (_, collection_id, alt) in enumerate(chunk):
+                definitions.append(f"$c{i}: CollectionInput!")
+                fields.append(f"u{i}: collectionUpdate(input: $c{i}) {{ userErrors {{ field message }} }}")
+                variables[f"c{i}"] = {'id': self.to_gid('Collection', collection_id), 'image': {'altText': alt}}
+            mutation = f"mutation({', '.join(definitions)}) {{ {' '.join(fields)} }}"
+
+            try:
+                data = self.graphql(mutation, variables, estimated_cost=10 * len(chunk))
+            except Exception as e:
+                for index, _, _ in chunk:
+                    results.at[index, 'status'] = 'error'
+                    results.at[index, 'error'] = str(e)
+                continue
+
+            for i, (index, collection_id, _) in enumerate(chunk):
+                message = "; ".join(error['message'] for error in data[f"u{i}"]['userErrors']) or None
+                results.at[index, 'status'] = 'error' if message else 'updated'
+                results.at[index, 'error'] = message
+                # Only successful updates are checkpointed, so a resumed run retries the errors
+                if not message:
+                    done.add(collection_id)
+            if checkpoint_path:
+                self._save_checkpoint(checkpoint_path, {'done': sorted(done)})
+
+        return results
+
     def update_collection_products(self, collection_handle, product_ids):
         # Step 1: Find the collection ID
         collection_id = self.read_collection_id(collection_handle)
@@ -78,58 +163,111 @@ class ShopifyCollections(ShopifyAPI):
             print(f"Collection '{collection_handle}' not found.")
             return
 
-        # Step 2: Clear existing products from the collection
-        self.delete_all_collection_products(collection_id)
+        # Step 2: Apply only the difference against the current membership
+        return self.sync_collection_products(collection_id, product_ids)
+
+    def sync_collection_products(self, collection_id, product_ids, batch_size=250):
+        """
+        Make the collection contain exactly `product_ids`.
 
-        # Step 3: Add new products to the collection
-        self._add_products_to_collection(collection_id, product_ids)
+        Only the difference with the current membership is applied, with
+        batched collectionAddProducts/collectionRemoveProducts mutations.
+        Additions go first, so the collection is never empty mid-update.
+        If any addition fails the removals are skipped, so a failed sync
+        never leaves the collection with fewer products than before.
 
-    def delete_all_collection_products(self, collection_id):
+        Args:
+            collection_id (int): Custom collection ID
+            product_ids (list): Product IDs the collection should contain
+            batch_size (int): Products per mutation (Shopify allows 250)
+
+        Returns:
+            dict: {'added': int, 'removed': int, 'failed': int} with the
+                products actually added/removed and those that failed
+        """
+        current = set(self.read_collection_product_ids(collection_id))
+        desired = [int(product_id) for product_id in dict.fromkeys(product_ids)]
+        to_add = [product_id for product_id in desired if product_id not in current]
+        to_remove = list(current - set(desired))
+
+        added = self._add_products_to_collection(collection_id, to_add, batch_size)
+        if len(added) < len(to_add):
+            print(f"Collection {collection_id}: {len(to_add) - len(added)} products failed to add, skipping removals")
+            return {'added': len(added), 'removed': 0, 'failed': len(to_add) - len(added)}
+        removed = self._remove_products_from_collection(collection_id, to_remove, batch_size)
+
+        print(f"Collection {collection_id} synced: {len(added)} added, {len(removed)} removed")
+        return {'added': len(added), 'removed': len(removed), 'failed': len(to_remove) - len(removed)}
+
+    def read_collection_product_ids(self, collection_id):
+        return [collect['product_id'] for collect in self.iter_records(
+            'collects.json', 'collects', params={'collection_id': collection_id}, fields=['product_id']
+        )]
+
+    def delete_all_collection_products(self, collection_id, batch_size=250):
         print(f"Clearing collection {collection_id}...")
-        url = urljoin(self.base_url, f"collects.json?collection_id={collection_id}&limit=250")
-        while url:
-            response = requests.get(url, headers=self.get_headers())
-            if response.status_code == 200:
-                collects = response.json().get('collects', [])
-                for collect in collects:
-                    delete_url = urljoin(self.base_url, f"collects/{collect['id']}.json")
-                    delete_response = requests.delete(delete_url, headers=self.get_headers())
-                    if delete_response.status_code == 200:
-                        print(f"Removed product {collect['product_id']} from collection {collection_id}")
-                    else:
-                        print(f"Failed to remove product {collect['product_id']} from collection {collection_id}: {delete_response.status_code}, {delete_response.text}")
-                    time.sleep(0.1)  # Rate limiting
-
-                # Check for pagination
-                link_header = response.headers.get('Link')
-                url = self._get_next_page_url(link_header)
-            else:
-                print(f"Failed to get collects for collection {collection_id}: {response.status_code}, {response.text}")
-                break
-        print(f"Finished clearing collection {collection_id}")
+        product_ids = self.read_collection_product_ids(collection_id)
+        removed = self._remove_products_from_collection(collection_id, product_ids, batch_size)
+        print(f"Finished clearing collection {collection_id}: {len(removed)} of {len(product_ids)} products removed")
+        return removed
 
 # AUX
-    def _get_next_page_url(self, link_header):
-        if not link_header:
-            return None
-        links = link_header.split(', ')
-        for link in links:
-            if 'rel="next"' in link:
-                return link[link.index('<')+1:link.index('>')]
-        return None
-
-    def _add_products_to_collection(self, collection_id, product_ids):
-        url = urljoin(self.base_url, "collects.json")
-        for product_id in product_ids:
-            data = {
-                "collect": {
-                    "product_id": product_id,
-                    "collection_id": collection_id
-                }
+    def _add_products_to_collection(self, collection_id, product_ids, batch_size=250):
+        # Returns the product IDs that were actually added
+        mutation = """
+        mutation collectionAddProducts($id: ID!, $productIds: [ID!]!) {
+            collectionAddProducts(id: $id, productIds: $productIds) {
+                userErrors { field message }
             }
-            response = requests.post(url, headers=self.get_headers(), json=data)
-            if response.status_code == 201:
-                print(f"Added product {product_id} to collection {collection_id}")
+        }
+        """
+        added = []
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            variables = {
+                'id': self.to_gid('Collection', collection_id),
+                'productIds': [self.to_gid('Product', product_id) for product_id in batch]
+            }
+            errors = self.graphql(mutation, variables, estimated_cost=10)['collectionAddProducts']['userErrors']
+            if errors:
+                print(f"Failed to add products to collection {collection_id}: {errors}")
             else:
-                print(f"Failed to add product {product_id} to collection {collection_id}: {response.status_code}, {response.text}")
-            time.sleep(0.1)  # Rate limiting
\ No newline at end of file
+                added.extend(batch)
+                print(f"Added {len(batch)} products to collection {collection_id}")
+        return added
+
+    def _remove_products_from_collection(self, collection_id, product_ids, batch_size=250, poll_interval=1):
+        # Returns the product IDs that were actually removed
+        mutation = """
+        mutation collectionRemoveProducts($id: ID!, $productIds: [ID!]!) {
+            collectionRemoveProducts(id: $id, productIds: $productIds) {
+                job { id done }
+                userErrors { field message }
+            }
+        }
+        """
+        job_query = """
+        query job($id: ID!) {
+            job(id: $id) { id done }
+        }
+        """
+        removed = []
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            variables = {
+                'id': self.to_gid('Collection', collection_id),
+                'productIds': [self.to_gid('Product', product_id) for product_id in batch]
+            }
+            result = self.graphql(mutation, variables, estimated_cost=10)['collectionRemoveProducts']
+            if result['userErrors']:
+                print(f"Failed to remove products from collection {collection_id}: {result['userErrors']}")
+                continue
+
+            # Removal runs as an asynchronous job; wait so callers see the final membership
+            job = result['job']
+            while job and not job['done']:
+                time.sleep(poll_interval)
+                job = self.graphql(job_query, {'id': job['id']}, estimated_cost=1)['job']
+            removed.extend(batch)
+            print(f"Removed {len(batch)} products from collection {collection_id}")
+        return removed
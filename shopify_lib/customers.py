@@ -1,70 +1,93 @@
 import sys
-sys.path.append('/home/snparada/Spacionatural/Libraries/shopify_lib')
-from api import ShopifyAPI
+sys.path.append('/home/snparada/Spacionatural/Libraries/')
+from shopify_lib.api import ShopifyAPI
 import pandas as pd
-import requests, json, time
-from urllib.parse import urljoin, urlparse
+import json
+from urllib.parse import urljoin
 
 class ShopifyCustomers(ShopifyAPI):
-    def __init__(self, shop_url=None, api_password=None, api_version="2024-01"):
-        super().__init__(shop_url, api_password, api_version)
+    def __init__(self, shop_url=None, api_password=None, api_version="2024-01", **kwargs):
+        super().__init__(shop_url, api_password, api_version, **kwargs)
 
     # CRUD
 
-    def read_all_customers(self):
-        customers = []
-        endpoint = 'customers.json?limit=250'
-        while endpoint:
-            full_url = urljoin(self.base_url, endpoint)
-            response = requests.get(full_url, headers=self.get_headers())
-
-            if response.status_code == 200 and response.content:
-                data = json.loads(response.content)
-                customers.extend(data['customers'])
-
-                next_link = response.links.get('next')
-                if next_link:
-                    next_url = next_link['url']
-                    parsed_url = urlparse(next_url)
-                    endpoint = parsed_url.path + "?" + parsed_url.query
-                else:
-                    endpoint = None
-            else:
-                print(f"Error al obtener clientes: {response.status_code}, {response.text}")
-                break
-
-        return customers
+    def read_all_customers(self, fields=None):
+        return list(self.iter_customers(fields=fields))
+
+    def iter_customers(self, fields=None, params=None):
+        """
+        Yield customers one at a time without holding them all in memory.
+
+        Args:
+            fields (list, optional): Only return these customer fields
+            params (dict, optional): Extra filters (e.g. {'updated_at_min': ...})
+        """
+        return self.iter_records('customers.json', 'customers', params=params, fields=fields)
 
     def read_all_customers_in_dataframe(self):
-        customers = self.read_all_customers()
-        customer_rows = []
-        for customer in customers:
-            row = {
-                'id': customer['id'],
-                'email': customer['email'],
-                'first_name': customer['first_name'],
-                'last_name': customer['last_name'],
-                'created_at': customer['created_at'],
-                'updated_at': customer['updated_at'],
-                'orders_count': customer['orders_count'],
-                'total_spent': customer['total_spent'],
-                'last_order_id': customer['last_order_id'],
-                'note': customer['note'],
-                'verified_email': customer['verified_email'],
-                'phone': customer['phone'],
-                'tags': customer['tags'],
-                'last_order_name': customer['last_order_name'],
-                'currency': customer['currency']
+        """
+        One row per customer, built page by page with typed columns
+        (UTC datetimes, Int64, decimals, nullable booleans).
+        """
+        fields = ['id', 'email', 'first_name', 'last_name', 'created_at', 'updated_at', 'orders_count',
+                  'total_spent', 'last_order_id', 'note', 'verified_email', 'phone', 'tags',
+                  'last_order_name', 'currency']
+
+        frames = [
+            pd.DataFrame.from_records(page, columns=fields)
+            for page in self.iter_pages('customers.json', 'customers', fields=fields)
+        ]
+
+        df_customers = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=fields)
+        return self._typed_dataframe(
+            df_customers,
+            datetime_columns=['created_at', 'updated_at'],
+            int_columns=['id', 'orders_count', 'last_order_id'],
+            decimal_columns=['total_spent'],
+            bool_columns=['verified_email'],
+            category_columns=['currency']
+        )
+
+    def bulk_export_customers(self, path=None, **kwargs):
+        """
+        Export every customer through a Bulk Operation.
+
+        Args:
+            path (str, optional): Parquet file to stream the rows into
+            **kwargs: Passed to ShopifyAPI.bulk_export
+
+        Returns:
+            pandas.DataFrame or str: Customer rows, or the Parquet path
+        """
+        query = """
+        {
+            customers {
+                edges {
+                    node {
+                        id
+                        email
+                        firstName
+                        lastName
+                        phone
+                        state
+                        verifiedEmail
+                        note
+                        tags
+                        numberOfOrders
+                        amountSpent { amount currencyCode }
+                        createdAt
+                        updatedAt
+                    }
+                }
             }
-            customer_rows.append(row)
-        
-        df_customers = pd.DataFrame(customer_rows)
-        return df_customers
+        }
+        """
+        return self.bulk_export(query, path=path, **kwargs)
 
     def read_customer_metafields(self, customer_id):
         endpoint = f"customers/{customer_id}/metafields.json"
         url = urljoin(self.base_url, endpoint)
-        response = requests.get(url, headers=self.get_headers())
+        response = self.request('GET', url)
         if response.status_code == 200:
             metafields = response.json().get('metafields', [])
             print(f"Metafields for customer {customer_id}: {json.dumps(metafields, indent=2)}")
@@ -73,18 +96,137 @@ class ShopifyCustomers(ShopifyAPI):
             print(f"Failed to retrieve metafields for customer {customer_id}: {response.status_code} - {response.text}")
             return None
 
+    def read_all_customer_metafields(self, customer_ids=None, namespace=None, **kwargs):
+        """
+        Metafields of many customers in batched GraphQL queries.
+
+        Args:
+            customer_ids (list, optional): Customers to read; all customers by default
+            namespace (str, optional): Only read this namespace
+            **kwargs: Passed to ShopifyAPI.read_metafields_bulk
+
+        Returns:
+            pandas.DataFrame: owner_id, metafield_id, namespace, key, value, type
+        """
+        if customer_ids is None:
+            customer_ids = [customer['id'] for customer in self.iter_customers(fields=['id'])]
+        return self.read_metafields_bulk('Customer', customer_ids, namespace=namespace, **kwargs)
+
     def update_customer(self, customer_id, update_data):
         update_url = urljoin(self.base_url, f"customers/{customer_id}.json")
         data = {
             "customer": update_data
         }
-        response = requests.put(update_url, json=data, headers=self.get_headers())
+        response = self.request('PUT', update_url, json=data)
         if response.status_code == 200:
             print(f"Customer {customer_id} was updated successfully.")
         else:
             print(f"Failed to update customer {customer_id}: {response.status_code} - {response.text}")
 
-        time.sleep(3)
+    def update_customers_bulk(self, df, id_column='customer_id', tags_column='tags', metafield_columns=None,
+                              namespace='facturacion', metafield_type='single_line_text_field', batch_size=25):
+        """
+        Add tags and set metafields for many customers with batched GraphQL mutations
+        (aliased tagsAdd calls and metafieldsSet, 25 customers/metafields per call).
+
+        Args:
+            df (pandas.DataFrame): One row per customer
+            id_column (str): Column with the customer ID
+            tags_column (str): Column with tags to add (list or comma-separated string);
+                ignored if missing
+            metafield_columns (list, optional): Columns written as metafields, the
+                column name being the metafield key. NaN values are skipped.
+            namespace (str): Metafield namespace
+            metafield_type (str): Metafield type
+            batch_size (int): Customers (tags) or metafields per mutation; Shopify caps metafieldsSet at 25
+
+        Returns:
+            pandas.DataFrame: Input rows plus 'status' ('updated', 'error') and 'error' columns
+        """
+        results = df.copy()
+        results['status'] = 'updated'
+        results['error'] = None
+
+        def record_error(index, message):
+            results.at[index, 'status'] = 'error'
+            previous = results.at[index, 'error']
+            results.at[index, 'error'] = f"{previous}; {message}" if previous else message
+
+        # IDs read from a DataFrame can be upcast to float (NaN, DB reads); 123.0 would
+        # become an invalid GID and Shopify rejects the whole batch
+        customer_gids = {}
+        for index, customer_id in results[id_column].items():
+            if pd.isna(customer_id):
+                record_error(index, f"Missing {id_column}")
+                continue
+            if isinstance(customer_id, float):
+                customer_id = int(customer_id)
+            customer_gids[index] = self.to_gid('Customer', customer_id)
+
+        # Tags: one aliased tagsAdd per customer
+        tag_rows = []
+        if tags_column in results.columns:
+            for index, row in results.iterrows():
+                if index not in customer_gids:
+                    continue
+                tags = row[tags_column]
+                if isinstance(tags, str):
+                    tags = [tag.strip() for tag in tags.split(',') if tag.strip()]
+                if isinstance(tags, (list, tuple)) and tags:
+                    tag_rows.append((index, customer_gids[index], list(tags)))
+
+        for start in range(0, len(tag_rows), batch_size):
+            chunk = tag_rows[start:start + batch_size]
+            definitions, fields, variables = [], [], {}
+            for i, (_, gid, tags) in enumerate(chunk):
+                definitions.append(f"$id{i}: ID!, $tags{i}: [String!]!")
+                fields.append(f"t{i}: tagsAdd(id: $id{i}, tags: $tags{i}) {{ userErrors {{ field message }} }}")
+                variables[f"id{i}"] = gid
+                variables[f"tags{i}"] = tags
+            mutation = f"mutation({', '.join(definitions)}) {{ {' '.join(fields)} }}"
+            try:
+                data = self.graphql(mutation, variables, estimated_cost=10 * len(chunk))
+                for i, (index, _, _) in enumerate(chunk):
+                    for user_error in data[f"t{i}"]['userErrors']:
+                        record_error(index, user_error['message'])
+            except Exception as e:
+                for index, _, _ in chunk:
+                    record_error(index, str(e))
+            print(f"Tags: {min(start + batch_size, len(tag_rows))}/{len(tag_rows)} clientes")
+
+        # Metafields: metafieldsSet accepts up to 25 metafields per call
+        metafield_rows = []
+        for column in metafield_columns or []:
+            for index, row in results.iterrows():
+                if index not in customer_gids or pd.isna(row[column]):
+                    continue
+                metafield_rows.append((index, {
+                    'ownerId': customer_gids[index],
+                    'namespace': namespace,
+                    'key': column,
+                    'type': metafield_type,
+                    'value': str(row[column])
+                }))
+
+        mutation = """
+        mutation metafieldsSet($metafields: [MetafieldsSetInput!]!) {
+            metafieldsSet(metafields: $metafields) {
+                userErrors { field message }
+            }
+        }
+        """
+        for start in range(0, len(metafield_rows), batch_size):
+            chunk = metafield_rows[start:start + batch_size]
+            try:
+                data = self.graphql(mutation, {'metafields': [metafield for _, metafield in chunk]}, estimated_cost=10)
+                row_errors = self._map_user_errors(data['metafieldsSet']['userErrors'], 'metafields', len(chunk))
+            except Exception as e:
+                row_errors = {position: str(e) for position in range(len(chunk))}
+            for position, error in row_errors.items():
+                record_error(chunk[position][0], error)
+            print(f"Metafields: {min(start + batch_size, len(metafield_rows))}/{len(metafield_rows)}")
+
+        return results
 
     def update_customer_metafield(self, customer_id, metafield_name, metafield_value):
         metafield_data = {
@@ -106,14 +248,12 @@ class ShopifyCustomers(ShopifyAPI):
 
     def delete_customer(self, customer_id):
         delete_url = urljoin(self.base_url, f"customers/{customer_id}.json")
-        response = requests.delete(delete_url, headers=self.get_headers())
+        response = self.request('DELETE', delete_url)
         if response.status_code == 200:
             print(f"Customer {customer_id} was deleted successfully.")
         else:
             print(f"Failed to delete customer {customer_id}: {response.status_code} - {response.text}")
 
-        time.sleep(3)
-
 # AUX Functions
 
     def export_customers_to_json(self, customers, path):
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests, hashlib, json, os, shutil, tempfile
+
+
+class ShopifyImageStore:
+    """
+    Local, content-addressed store of Shopify images.
+
+    Binaries live under `objects/<hash[:2]>/<hash><ext>`, so the same image
+    used by several products is stored once. `manifest.json` keeps each
+    image's metadata, its hash and ETag, and the last sync time per source,
+    so repeat runs only transfer new or changed images.
+    """
+
+    def __init__(self, store_dir, session=None, timeout=30):
+        self.store_dir = store_dir
+        self.objects_dir = os.path.join(store_dir, 'objects')
+        self.manifest_path = os.path.join(store_dir, 'manifest.json')
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+        # (source, owner_id) -> image keys, so replacing one owner's images doesn't scan them all
+        self.owner_keys = {}
+        for key, entry in self.manifest['images'].items():
+            self.owner_keys.setdefault((entry['source'], entry['owner_id']), set()).add(key)
+
+    def synced_at(self, source):
+        return self.manifest['synced_at'].get(source)
+
+    def update_owner_images(self, source, owner_id, images):
+        """
+        Replace the images of one owner (product or collection) with `images`.
+        Hash, ETag and local path are kept for images whose key survives.
+
+        Args:
+            source (str): 'products' or 'collections'
+            owner_id (int): Owner ID
+            images (list): Dicts with at least 'key', 'src' and 'updated_at'
+        """
+        stale = self.owner_keys.pop((source, owner_id), set())
+        previous = {key: self.manifest['images'].pop(key) for key in stale if key in self.manifest['images']}
+        for image in images:
+            entry = {**previous.get(image['key'], {}), **image, 'source': source, 'owner_id': owner_id}
+            self.manifest['images'][image['key']] = entry
+        self.owner_keys[(source, owner_id)] = {image['key'] for image in images}
+
+    def download(self, max_workers=8):
+        """
+        Download, concurrently, every image that is new, changed or missing on disk.
+        Changed images are requested with If-None-Match, so an unchanged binary
+        costs a 304 instead of a transfer.
+
+        Returns:
+            int: Number of binaries actually transferred
+        """
+        pending = [entry for entry in self.manifest['images'].values() if self._needs_download(entry)]
+        if not pending:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(self._download, pending))
+
+        transferred = 0
+        for entry, result in zip(pending, results):
+            if result is None:
+                continue
+            transferred += result.pop('transferred', 0)
+            entry.update(result)
+        print(f"Imágenes descargadas: {transferred}, sin cambios: {len(pending) - transferred}")
+        return transferred
+
+    def images(self, source=None):
+        """List the stored images, with 'local_path' pointing at the binary."""
+        return [dict(entry) for entry in self.manifest['images'].values()
+                if source is None or entry['source'] == source]
+
+    def save(self, source=None, synced_at=None):
+        if source and synced_at:
+            self.manifest['synced_at'][source] = synced_at
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+# AUX Functions
+
+    def _needs_download(self, entry):
+        if not entry.get('local_path') or not os.path.exists(entry['local_path']):
+            return True
+        return entry.get('downloaded_src') != entry['src'] or entry.get('downloaded_updated_at') != entry['updated_at']
+
+    def _download(self, entry):
+        headers = {}
+        has_local_copy = entry.get('local_path') and os.path.exists(entry['local_path'])
+        if entry.get('etag') and has_local_copy:
+            headers['If-None-Match'] = entry['etag']
+
+        tmp = None
+        try:
+            with self.session.get(entry['src'], headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 304:
+                    return {'downloaded_src': entry['src'], 'downloaded_updated_at': entry['updated_at']}
+                response.raise_for_status()
+
+                # Hash while streaming to a temp file, then move it to its content address
+                digest = hashlib.sha256()
+                with tempfile.NamedTemporaryFile(dir=self.objects_dir, delete=False) as tmp:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        digest.update(chunk)
+                        tmp.write(chunk)
+                sha256 = digest.hexdigest()
+                etag = response.headers.get('ETag')
+        except Exception as e:
+            print(f"Error al descargar {entry['src']}: {e}")
+            if tmp is not None and os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            return None
+
+        extension = os.path.splitext(urlparse(entry['src']).path)[1] or '.jpg'
+        local_path = os.path.join(self.objects_dir, sha256[:2], f"{sha256}{extension}")
+        if os.path.exists(local_path):
+            os.remove(tmp.name)
+        else:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            shutil.move(tmp.name, local_path)
+
+        return {
+            'sha256': sha256,
+            'etag': etag,
+            'local_path': local_path,
+            'downloaded_src': entry['src'],
+            'downloaded_updated_at': entry['updated_at'],
+            'transferred': 1
+        }
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        return {'synced_at': {}, 'images': {}}
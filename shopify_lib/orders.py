@@ -1,7 +1,9 @@
 import pandas as pd
 import sys
+import os
 import json
 import time
+from datetime import datetime
 from requests.exceptions import HTTPError
 sys.path.append('/home/snparada/Spacionatural/Libraries/')
 from shopify_lib.api import ShopifyAPI
@@ -10,9 +12,9 @@ from pprint import pprint
 
 class ShopifyOrders(ShopifyAPI):
 
-    def __init__(self, shop_url=None, api_password=None, api_version=None):
-        super().__init__(shop_url, api_password, api_version)
-        self.customers = ShopifyCustomers()
+    def __init__(self, shop_url=None, api_password=None, api_version=None, **kwargs):
+        super().__init__(shop_url, api_password, api_version, **kwargs)
+        self.customers = ShopifyCustomers(shop_url, api_password, api_version, **kwargs)
         
 
 #--------------------CRUD FUNCTIONS --------------------
@@ -104,7 +106,7 @@ class ShopifyOrders(ShopifyAPI):
             datas.append(order)
         return since_id, datas
 
-    def read_all_orders_by_date(self, start_date, end_date, order_status=None):
+    def read_all_orders_by_date(self, start_date, end_date, order_status=None, fields=None):
         """
         Retrieve all orders between two dates using REST API pagination.
         
@@ -112,36 +114,149 @@ class ShopifyOrders(ShopifyAPI):
             start_date (str): Start date in ISO format (YYYY-MM-DD)
             end_date (str): End date in ISO format (YYYY-MM-DD)
             order_status (str, optional): Filter by order status
+            fields (list, optional): Only return these order fields
             
         Returns:
             list: List of orders within the date range
         """
-        datas = []
-        
-        base_params = {
-            'limit': 250,
+        return list(self.iter_orders_by_date(start_date, end_date, order_status, fields))
+
+    def iter_orders_by_date(self, start_date, end_date, order_status=None, fields=None):
+        """
+        Yield the orders between two dates one at a time, prefetching the next page.
+        Same arguments as read_all_orders_by_date.
+        """
+        params = {
             'created_at_min': start_date,
             'created_at_max': end_date,
             'status': order_status if order_status else 'any'
         }
+        return self.iter_records('orders.json', 'orders', params=params, fields=fields)
+
+    def bulk_export_orders(self, start_date=None, end_date=None, path=None, **kwargs):
+        """
+        Export orders through a Bulk Operation instead of paging the REST API.
+        
+        Args:
+            start_date (str, optional): Start date in ISO format (YYYY-MM-DD)
+            end_date (str, optional): End date in ISO format (YYYY-MM-DD)
+            path (str, optional): Parquet file to stream the rows into
+            **kwargs: Passed to ShopifyAPI.bulk_export
+            
+        Returns:
+            pandas.DataFrame or str: Order rows, or the Parquet path
+        """
+        filters = []
+        if start_date:
+            filters.append(f"created_at:>='{start_date}'")
+        if end_date:
+            filters.append(f"created_at:<='{end_date}'")
+        search = f'(query: "{" ".join(filters)}")' if filters else ''
+
+        query = f"""
+        {{
+            orders{search} {{
+                edges {{
+                    node {{
+                        id
+                        name
+                        email
+                        createdAt
+                        updatedAt
+                        processedAt
+                        cancelledAt
+                        displayFinancialStatus
+                        displayFulfillmentStatus
+                        tags
+                        customer {{ id }}
+                        currentTotalPriceSet {{ shopMoney {{ amount currencyCode }} }}
+                        totalDiscountsSet {{ shopMoney {{ amount currencyCode }} }}
+                    }}
+                }}
+            }}
+        }}
+        """
+        return self.bulk_export(query, path=path, **kwargs)
+    
+    def sync_orders(self, checkpoint_path, output_dir=None, db=None, table_name='shopify_orders', start_date=None, order_status='any'):
+        """
+        Incrementally sync every order changed since the last run.
+
+        Orders are paged by updated_at ascending. Each page is written as an
+        append-only batch (a Parquet file in output_dir, or rows in `table_name`
+        through database_lib.DB) before the checkpoint is advanced, so a crash
+        resumes from the next unwritten page instead of starting over.
+        
+        Args:
+            checkpoint_path (str): JSON file holding the sync state
+            output_dir (str, optional): Directory for the Parquet batches
+            db (DB, optional): database_lib.DB instance to load the batches into
+            table_name (str): Table used when db is given
+            start_date (str, optional): updated_at lower bound for the first run
+            order_status (str): Order status filter ('any' by default)
+            
+        Returns:
+            int: Number of orders written in this call
+        """
+        if output_dir is None and db is None:
+            raise ValueError("Either output_dir or db must be provided")
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        checkpoint = self._load_checkpoint(checkpoint_path) or {
+            'updated_at_min': start_date,
+            'run_id': None,
+            'next_url': None,
+            'page': 0,
+            'max_updated_at': None
+        }
 
-        # Bucle de paginación
-        while True:
-            data = self.read('orders.json', params=base_params)
-            orders = data.get('orders', [])
-            datas.extend(orders)
+        if checkpoint['next_url']:
+            print(f"Resuming order sync {checkpoint['run_id']} at page {checkpoint['page']}")
+            endpoint, params = checkpoint['next_url'], None
+        else:
+            checkpoint.update(run_id=datetime.now().strftime('%Y%m%d%H%M%S'), page=0, max_updated_at=None)
+            endpoint = 'orders.json'
+            params = {'limit': 250, 'status': order_status, 'order': 'updated_at asc'}
+            if checkpoint['updated_at_min']:
+                params['updated_at_min'] = checkpoint['updated_at_min']
 
-            # Verificar si hay más páginas usando los headers de Link
-            links = self.last_response.headers.get('Link', '')
-            if 'rel="next"' not in links:
-                break
+        written = 0
+        while endpoint:
+            response = self.request('GET', endpoint, params=params)
+            if response.status_code != 200:
+                if params is None:
+                    # The saved cursor expired; restart from the last order written
+                    restart_from = checkpoint['max_updated_at'] or checkpoint['updated_at_min']
+                    print(f"Could not resume cursor ({response.status_code}); restarting from {restart_from}")
+                    endpoint = 'orders.json'
+                    params = {'limit': 250, 'status': order_status, 'order': 'updated_at asc'}
+                    if restart_from:
+                        params['updated_at_min'] = restart_from
+                    continue
+                response.raise_for_status()
 
-            # Extraer el page_info del header Link para la siguiente página
-            next_link = [link for link in links.split(', ') if 'rel="next"' in link][0]
-            page_info = next_link.split('page_info=')[1].split('>')[0]
-            base_params['page_info'] = page_info
+            orders = response.json().get('orders', [])
+            if orders:
+                self._write_orders_batch(orders, checkpoint, output_dir, db, table_name)
+                written += len(orders)
+                latest = max(orders, key=lambda order: datetime.fromisoformat(order['updated_at']))['updated_at']
+                if not checkpoint['max_updated_at'] or datetime.fromisoformat(latest) > datetime.fromisoformat(checkpoint['max_updated_at']):
+                    checkpoint['max_updated_at'] = latest
 
-        return datas
+            next_link = response.links.get('next')
+            endpoint, params = (next_link['url'], None) if next_link else (None, None)
+            checkpoint['page'] += 1
+            checkpoint['next_url'] = endpoint
+            self._save_checkpoint(checkpoint_path, checkpoint)
+
+        # Run finished: the next one starts where this one ended
+        if checkpoint['max_updated_at']:
+            checkpoint['updated_at_min'] = checkpoint['max_updated_at']
+        checkpoint['next_url'] = None
+        self._save_checkpoint(checkpoint_path, checkpoint)
+        print(f"Order sync {checkpoint['run_id']} finished: {written} orders written")
+        return written
     
     def read_order_by_number(self, order_number):
         """
@@ -176,3 +291,24 @@ class ShopifyOrders(ShopifyAPI):
 
 
 # ----------------------AUX FUNCTIONS ----------------------
+
+    def _orders_to_dataframe(self, orders):
+        df = pd.DataFrame(orders)
+        # Nested objects (line_items, customer, addresses...) are stored as JSON text
+        for column in df.columns:
+            if df[column].map(lambda value: isinstance(value, (dict, list))).any():
+                df[column] = df[column].map(lambda value: json.dumps(value) if isinstance(value, (dict, list)) else value)
+        return df
+
+    def _write_orders_batch(self, orders, checkpoint, output_dir, db, table_name):
+        df = self._orders_to_dataframe(orders)
+        if output_dir:
+            # Named after run and page, so a page re-fetched after a crash overwrites itself
+            path = os.path.join(output_dir, f"orders_{checkpoint['run_id']}_{checkpoint['page']:05d}.parquet")
+            df.to_parquet(path, index=False)
+        if db is not None:
+            # Orders may reappear in later runs after being updated; keep only the latest version.
+            # Delete and insert run in one transaction so a failure never leaves duplicates
+            df['id'] = df['id'].astype('int64')
+            if not db.replace_dataframe_rows(table_name, df, 'id'):
+                raise Exception(f"Could not load orders batch {checkpoint['page']} into {table_name}")
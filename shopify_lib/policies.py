@@ -4,8 +4,8 @@ from shopify_lib.api import ShopifyAPI
 from bs4 import BeautifulSoup
 
 class ShopifyPolicies(ShopifyAPI):
-    def __init__(self, shop_url=None, api_password=None, api_version="2024-01"):
-        super().__init__(shop_url, api_password, api_version)
+    def __init__(self, shop_url=None, api_password=None, api_version="2024-01", **kwargs):
+        super().__init__(shop_url, api_password, api_version, **kwargs)
 
     def _parse_policy_content(self, html_content):
         """
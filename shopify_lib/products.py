@@ -1,119 +1,182 @@
 import sys
-sys.path.append('/home/snparada/Spacionatural/Libraries/shopify_lib')
-from api import ShopifyAPI
+sys.path.append('/home/snparada/Spacionatural/Libraries/')
+from shopify_lib.api import ShopifyAPI
+from shopify_lib.image_store import ShopifyImageStore
 import pandas as pd
-import requests, json, time
+import json, os
+from datetime import datetime
 from urllib.parse import quote,urljoin, urlparse
+from concurrent.futures import ThreadPoolExecutor
 
 
 class ShopifyProducts(ShopifyAPI):
-    def __init__(self, shop_url=None, api_password=None, api_version="2024-01"):
-        super().__init__(shop_url, api_password, api_version)
-        self.sku_to_product_id = self.map_sku_to_product_id()
+    def __init__(self, shop_url=None, api_password=None, api_version="2024-01", sku_cache_path=None, **kwargs):
+        super().__init__(shop_url, api_password, api_version, **kwargs)
+        # The SKU index is built on first use and persisted between runs
+        shop_host = urlparse(self.shop_url).netloc or self.shop_url
+        self.sku_cache_path = sku_cache_path or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'cache', f"sku_index_{shop_host}.json"
+        )
+        self._sku_index = None
+
+    @property
+    def sku_index(self):
+        """
+        SKU index: {'synced_at', 'skus': {sku: {product_id, variant_id, inventory_item_id}},
+        'locations': {inventory_item_id: location_id}}. Loaded from the cache file and
+        refreshed incrementally the first time it is accessed.
+        """
+        if self._sku_index is None:
+            self.refresh_sku_index()
+        return self._sku_index
+
+    @property
+    def sku_to_product_id(self):
+        return {sku: entry['product_id'] for sku, entry in self.sku_index['skus'].items()}
 
 # CRUD      
     
-    def read_all_products(self):       
-        products = []
-        endpoint = 'products.json?limit=250'
-        while endpoint:
-            full_url = urljoin(self.base_url, endpoint)
-            response = requests.get(full_url, headers=self.get_headers())
-
-            if response.status_code == 200 and response.content:
-                data = json.loads(response.content)
-                products.extend(data['products'])
-
-                next_link = response.links.get('next')
-                if next_link:
-                    next_url = next_link['url']
-                    parsed_url = urlparse(next_url)
-                    endpoint = parsed_url.path + "?" + parsed_url.query
-                else:
-                    endpoint = None
-            else:
-                print(f"Error al obtener productos: {response.status_code}, {response.text}")
-                break
+    def read_all_products(self, fields=None):
+        return list(self.iter_products(fields=fields))
 
-        return products
+    def iter_products(self, fields=None, params=None):
+        """
+        Yield products one at a time without holding the whole catalog in memory.
 
-    def read_all_products_in_dataframe(self):            
-        products = []
-        endpoint = 'products.json?limit=250'
-        
-        # Imprimir la URL base para depuración
-        print(f"Base URL: {self.base_url}")
-        print(f"Endpoint completo: {urljoin(self.base_url, endpoint)}")
-        
-        # Loop para obtener todos los productos
-        while endpoint:
-            full_url = urljoin(self.base_url, endpoint)
-            print(f"Intentando conectar a: {full_url}")
-            response = requests.get(full_url, headers=self.get_headers())
-            
-            # Imprimir headers para depuración
-            print(f"Headers utilizados: {self.get_headers()}")
-            
-            if response.status_code == 200 and response.content:
-                data = json.loads(response.content)
-                products.extend(data['products'])
-
-                # Verificar si hay un enlace "next" para continuar
-                next_link = response.links.get('next')
-                if next_link:
-                    next_url = next_link['url']
-                    parsed_url = urlparse(next_url)
-                    endpoint = parsed_url.path + "?" + parsed_url.query
-                else:
-                    endpoint = None
-            else:
-                print(f"Error al obtener productos: {response.status_code}, {response.text}")
-                break
+        Args:
+            fields (list, optional): Only return these product fields
+            params (dict, optional): Extra filters (e.g. {'updated_at_min': ...})
+        """
+        return self.iter_records('products.json', 'products', params=params, fields=fields)
 
-        # Expandir las variantes a nivel de filas
-        product_rows = []
-        for product in products:
-            for variant in product['variants']:
-                row = {
-                    'id': product['id'],
-                    'title': product['title'],
-                    'vendor': product['vendor'],
-                    'body_html': product['body_html'],
-                    'product_type': product['product_type'],
-                    'created_at': product['created_at'],
-                    'handle': product['handle'],
-                    'updated_at': product['updated_at'],
-                    'published_at': product['published_at'],
-                    'tags': product['tags'],
-                    'status': product['status'],
-                    'variant_id': variant['id'],
-                    'variant_title': variant['title'],
-                    'variant_compare_at_price': variant.get('compare_at_price'),
-                    'variant_price': variant['price'],
-                    'variant_sku': variant['sku'],
-                    'variant_inventory_quantity': variant['inventory_quantity']
+    def read_all_products_in_dataframe(self):
+        """
+        One row per variant with its product fields, built page by page with
+        pd.json_normalize and typed columns (UTC datetimes, Int64, decimals).
+        """
+        product_fields = ['id', 'title', 'vendor', 'body_html', 'product_type', 'created_at', 'handle',
+                          'updated_at', 'published_at', 'tags', 'status']
+        variant_fields = ['variant_id', 'variant_title', 'variant_compare_at_price', 'variant_price',
+                          'variant_sku', 'variant_inventory_quantity']
+
+        frames = []
+        for page in self.iter_pages('products.json', 'products', fields=product_fields + ['variants']):
+            df = pd.json_normalize(page, record_path='variants', meta=product_fields,
+                                   record_prefix='variant_', errors='ignore')
+            frames.append(df.reindex(columns=product_fields + variant_fields))
+
+        df_products = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=product_fields + variant_fields)
+        return self._typed_dataframe(
+            df_products,
+            datetime_columns=['created_at', 'updated_at', 'published_at'],
+            int_columns=['id', 'variant_id', 'variant_inventory_quantity'],
+            decimal_columns=['variant_price', 'variant_compare_at_price'],
+            category_columns=['vendor', 'product_type', 'status']
+        )
+
+    def bulk_export_products(self, path=None, **kwargs):
+        """
+        Export every variant with its product fields through a Bulk Operation.
+        One row per variant, product columns prefixed with 'product_'.
+
+        Args:
+            path (str, optional): Parquet file to stream the rows into
+            **kwargs: Passed to ShopifyAPI.bulk_export
+
+        Returns:
+            pandas.DataFrame or str: Variant rows, or the Parquet path
+        """
+        query = """
+        {
+            productVariants {
+                edges {
+                    node {
+                        id
+                        sku
+                        title
+                        price
+                        compareAtPrice
+                        inventoryQuantity
+                        createdAt
+                        updatedAt
+                        inventoryItem { id }
+                        product {
+                            id
+                            title
+                            handle
+                            vendor
+                            productType
+                            status
+                            tags
+                            createdAt
+                            updatedAt
+                            publishedAt
+                        }
+                    }
                 }
-                product_rows.append(row)
-        
-        # Convertir la lista de filas a un DataFrame
-        df_products = pd.DataFrame(product_rows)
-        
-        return df_products
+            }
+        }
+        """
+        return self.bulk_export(query, path=path, **kwargs)
 
     def read_all_images(self):
         images = []
-        products = self.read_all_products()
-        for product in products:
+        for product in self.iter_products(fields=['id', 'body_html', 'images']):
             for image in product['images']:
                 image['description'] = product['body_html']
                 images.append(image)
         return images
 
+    def sync_images(self, store_dir, max_workers=8):
+        """
+        Mirror product images into a local content-addressed store.
+
+        Only products updated since the last sync are read, and only new or
+        changed binaries are downloaded (concurrently). Images of deleted
+        products stay in the store.
+
+        Args:
+            store_dir (str): Directory of the ShopifyImageStore
+            max_workers (int): Concurrent downloads
+
+        Returns:
+            list: Image dicts (as in read_all_images) plus 'sha256' and 'local_path'
+        """
+        store = ShopifyImageStore(store_dir, session=self.session)
+        synced_at = store.synced_at('products')
+        params = {'updated_at_min': synced_at} if synced_at else None
+
+        # Pages come in id order, not updated_at order: the watermark only moves after
+        # every page was read. On failure the images gathered so far are still stored.
+        try:
+            for product in self.iter_products(fields=['id', 'body_html', 'images', 'updated_at'], params=params):
+                images = [{
+                    'key': f"product:{image['id']}",
+                    'id': image['id'],
+                    'product_id': product['id'],
+                    'src': image['src'],
+                    'alt': image.get('alt'),
+                    'position': image.get('position'),
+                    'updated_at': image['updated_at'],
+                    'description': product['body_html']
+                } for image in product['images']]
+                store.update_owner_images('products', product['id'], images)
+                if not synced_at or datetime.fromisoformat(product['updated_at']) > datetime.fromisoformat(synced_at):
+                    synced_at = product['updated_at']
+        except Exception:
+            store.download(max_workers)
+            store.save()
+            raise
+
+        store.download(max_workers)
+        store.save('products', synced_at)
+        return store.images('products')
+
     def read_actual_complementary_products(self, product_id):
         endpoint = f"products/{product_id}/metafields.json"
         url = urljoin(self.base_url, endpoint)
         
-        response = requests.get(url, headers=self.get_headers())
+        response = self.request('GET', url)
         if response.status_code == 200:
             metafields = response.json().get('metafields', [])
             complementary_metafield = next((m for m in metafields if m['namespace'] == "shopify--discovery--product_recommendation" and m['key'] == "complementary_products"), None)
@@ -128,14 +191,17 @@ class ShopifyProducts(ShopifyAPI):
             return None
 
     def read_variant_id_by_sku(self, sku):
-        # Primero, intentamos obtener el product_id usando el mapa sku_to_product_id
-        product_id = self.sku_to_product_id.get(sku)
+        # Primero, buscamos en el índice local de SKUs
+        entry = self.sku_index['skus'].get(sku)
+        if entry and entry.get('variant_id'):
+            return entry['variant_id']
+        product_id = entry['product_id'] if entry else None
         
         if product_id:
             # Si encontramos el product_id, buscamos la variante específica
             endpoint = f"products/{product_id}.json"
             url = urljoin(self.base_url, endpoint)
-            response = requests.get(url, headers=self.get_headers())
+            response = self.request('GET', url)
             
             if response.status_code == 200:
                 product_data = response.json()['product']
@@ -146,7 +212,7 @@ class ShopifyProducts(ShopifyAPI):
         # Si no encontramos el producto o la variante, hacemos una búsqueda más amplia
         endpoint = f"variants.json?sku={sku}"
         url = urljoin(self.base_url, endpoint)
-        response = requests.get(url, headers=self.get_headers())
+        response = self.request('GET', url)
         
         if response.status_code == 200:
             variants = response.json()['variants']
@@ -160,7 +226,7 @@ class ShopifyProducts(ShopifyAPI):
     def read_product_metafields(self, product_id):
         endpoint = f"products/{product_id}/metafields.json"
         url = urljoin(self.base_url, endpoint)
-        response = requests.get(url, headers=self.get_headers())
+        response = self.request('GET', url)
         if response.status_code == 200:
             metafields = response.json().get('metafields', [])
             print(f"Metafields for product {product_id}: {json.dumps(metafields, indent=2)}")
@@ -169,17 +235,43 @@ class ShopifyProducts(ShopifyAPI):
             print(f"Failed to retrieve metafields for product {product_id}: {response.status_code} - {response.text}")
             return None
 
+    def read_all_product_metafields(self, product_ids=None, namespace=None, **kwargs):
+        """
+        Metafields of many products in batched GraphQL queries.
+
+        Args:
+            product_ids (list, optional): Products to read; all products by default
+            namespace (str, optional): Only read this namespace
+            **kwargs: Passed to ShopifyAPI.read_metafields_bulk
+
+        Returns:
+            pandas.DataFrame: owner_id, metafield_id, namespace, key, value, type
+        """
+        if product_ids is None:
+            product_ids = [product['id'] for product in self.iter_products(fields=['id'])]
+        return self.read_metafields_bulk('Product', product_ids, namespace=namespace, **kwargs)
+
+    def read_all_complementary_products(self, product_ids=None, **kwargs):
+        """Bulk version of read_actual_complementary_products: one row per product that has them."""
+        df = self.read_all_product_metafields(product_ids, namespace="shopify--discovery--product_recommendation", **kwargs)
+        return df[df['key'] == "complementary_products"].reset_index(drop=True)
+
     def read_location_id(self, inventory_item_id):
+        location_id = self.sku_index['locations'].get(str(inventory_item_id))
+        if location_id:
+            return location_id
+
         endpoint = f"inventory_levels.json?inventory_item_ids={inventory_item_id}"
         # Construye la URL completa usando self.base_url
         inventory_url = urljoin(self.base_url, endpoint)
 
         # Realiza la petición GET usando self.get_headers() para incluir las cabeceras correctas
-        response = requests.get(inventory_url, headers=self.get_headers())
+        response = self.request('GET', inventory_url)
 
         if response.status_code == 200:
             inventory_data = response.json()["inventory_levels"]
             if inventory_data:
+                self.sku_index['locations'][str(inventory_item_id)] = inventory_data[0]["location_id"]
                 return inventory_data[0]["location_id"]
             else:
                 print(f"No se encontraron niveles de inventario para el inventory_item_id {inventory_item_id}")
@@ -193,7 +285,7 @@ class ShopifyProducts(ShopifyAPI):
         endpoint = f"products/{product_id}/metafields.json"
         url = urljoin(self.base_url, endpoint)
         
-        response = requests.get(url, headers=self.get_headers())
+        response = self.request('GET', url)
         if response.status_code == 200:
             metafields = response.json().get('metafields', [])
             complementary_metafield = next((m for m in metafields if m['namespace'] == "shopify--discovery--product_recommendation" and m['key'] == "complementary_products"), None)
@@ -214,7 +306,7 @@ class ShopifyProducts(ShopifyAPI):
                         }
                     }
                     update_url = urljoin(self.base_url, f"metafields/{metafield_id}.json")
-                    response = requests.put(update_url, json=data, headers=self.get_headers())
+                    response = self.request('PUT', update_url, json=data)
             else:
                 # Crear un nuevo metafield si no existe
                 data = {
@@ -225,7 +317,7 @@ class ShopifyProducts(ShopifyAPI):
                         "type": "list.product_reference"
                     }
                 }
-                response = requests.post(url, json=data, headers=self.get_headers())
+                response = self.request('POST', url, json=data)
             
             if response.status_code not in [200, 201]:
                 print(f"Failed to update complementary product {complementary_product_id} for product {product_id}: {response.status_code} - {response.text}")
@@ -241,12 +333,106 @@ class ShopifyProducts(ShopifyAPI):
                 "alt": new_alt
             }
         }
-        response = requests.put(update_url, json=data, headers=self.get_headers())
+        response = self.request('PUT', update_url, json=data)
         if response.status_code == 200:
             print(f"{image_id} image was updated")
         else:
             print(f"{image_id} image updating was failed")
 
+    def update_images_seo_bulk(self, df, product_column='product_id', image_column='image_id', alt_column='alt',
+                               checkpoint_path=None, products_per_request=10, max_workers=2):
+        """
+        Update image alt texts grouped per product: one aliased productUpdateMedia
+        per product, `products_per_request` products per GraphQL call.
+
+        Args:
+            df (pandas.DataFrame): One row per image with product ID, REST image ID and new alt
+            product_column, image_column, alt_column (str): Column names
+            checkpoint_path (str, optional): JSON file with the products already done;
+                an interrupted run resumes where it stopped
+            products_per_request (int): Products per GraphQL call
+            max_workers (int): Concurrent calls (the GraphQL limiter still paces them)
+
+        Returns:
+            pandas.DataFrame: Input rows plus 'status' ('updated', 'skipped',
+                'not_found', 'error') and 'error' columns
+        """
+        results = df.copy()
+        results['status'] = None
+        results['error'] = None
+
+        checkpoint = (self._load_checkpoint(checkpoint_path) if checkpoint_path else None) or {'done': []}
+        done = set(checkpoint['done'])
+
+        by_product = {}
+        for index, row in results.iterrows():
+            product_id = int(row[product_column])
+            if product_id in done:
+                results.at[index, 'status'] = 'skipped'
+                continue
+            by_product.setdefault(product_id, []).append((index, int(row[image_column]), row[alt_column]))
+
+        product_ids = list(by_product)
+        chunks = [product_ids[start:start + products_per_request] for start in range(0, len(product_ids), products_per_request)]
+
+        def update_chunk(chunk):
+            # Runs on a worker thread: returns {index: (status, error)} and leaves the DataFrame alone
+            statuses = {}
+            try:
+                media_ids = self._read_product_image_media_ids(chunk)
+                definitions, fields, variables, aliases = [], [], {}, {}
+                for i, product_id in enumerate(chunk):
+                    media = []
+                    for index, image_id, alt in by_product[product_id]:
+                        media_id = media_ids.get(image_id)
+                        if media_id:
+                            media.append({'id': media_id, 'alt': alt})
+                        else:
+                            statuses[index] = ('not_found', None)
+                    if not media:
+                        continue
+                    definitions.append(f"$p{i}: ID!, $m{i}: [UpdateMediaInput!]!")
+                    fields.append(f"u{i}: productUpdateMedia(productId: $p{i}, media: $m{i}) {{ mediaUserErrors {{ field message }} }}")
+                    variables[f"p{i}"] = self.to_gid('Product', product_id)
+                    variables[f"m{i}"] = media
+                    aliases[product_id] = f"u{i}"
+
+                data = {}
+                if fields:
+                    mutation = f"mutation({', '.join(definitions)}) {{ {' '.join(fields)} }}"
+                    data = self.graphql(mutation, variables, estimated_cost=10 * len(fields))
+
+                for product_id in chunk:
+                    errors = data[aliases[product_id]]['mediaUserErrors'] if product_id in aliases else []
+                    message = "; ".join(error['message'] for error in errors) or None
+                    for index, _, _ in by_product[product_id]:
+                        if index not in statuses:
+                            statuses[index] = ('error', message) if message else ('updated', None)
+            except Exception as e:
+                for product_id in chunk:
+                    for index, _, _ in by_product[product_id]:
+                        statuses[index] = ('error', str(e))
+            return chunk, statuses
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for chunk, statuses in executor.map(update_chunk, chunks):
+                for index, (status, error) in statuses.items():
+                    results.at[index, 'status'] = status
+                    results.at[index, 'error'] = error
+
+                # Only products whose images were all updated are checkpointed;
+                # errors and not_found images are retried by a resumed run
+                completed = [
+                    product_id for product_id in chunk
+                    if all(statuses[index][0] == 'updated' for index, _, _ in by_product[product_id])
+                ]
+                if checkpoint_path and completed:
+                    done.update(completed)
+                    self._save_checkpoint(checkpoint_path, {'done': sorted(done)})
+                    print(f"Alt text: {len(done)} productos completados")
+
+        return results
+
     def update_stock(self, inventory_item_id, new_stock, sku):
         location_id = self.read_location_id(inventory_item_id)
         if location_id:
@@ -259,7 +445,7 @@ class ShopifyProducts(ShopifyAPI):
                 "available": new_stock
             }
             # Usa self.get_headers() para obtener las cabeceras correctas
-            response = requests.post(update_url, json=data, headers=self.get_headers())
+            response = self.request('POST', update_url, json=data)
             if response.status_code == 200:
                 print(f"Stock actualizado para SKU {sku}.")
             else:
@@ -267,9 +453,6 @@ class ShopifyProducts(ShopifyAPI):
         else:
             print(f"No se pudo obtener el location_id para inventory_item_id {inventory_item_id}")
 
-        # Espera para evitar saturar la API o violar los límites de la tasa de solicitud
-        time.sleep(1)
-
     def update_price(self, variant_id, new_price, sku):
         update_url = urljoin(self.base_url, f"variants/{variant_id}.json")
         data = {
@@ -278,15 +461,11 @@ class ShopifyProducts(ShopifyAPI):
                 "price": new_price
             }
         }
-        response = requests.put(update_url, json=data, headers=self.get_headers())
+        response = self.request('PUT', update_url, json=data)
         if response.status_code == 200:
             print(f"Precio actualizado para el sku {sku}")
         else:
             print(f"Error al actualizar el precio para el {sku}: {response.text}")
-
-        # Pausa después de cada actualización
-        print("durmiendo...")
-        time.sleep(1)
     
     def update_price_comparison(self, variant_id, compare_at_price, sku):
         update_url = urljoin(self.base_url, f"variants/{variant_id}.json")
@@ -296,20 +475,146 @@ class ShopifyProducts(ShopifyAPI):
                 "compare_at_price": compare_at_price
             }
         }
-        response = requests.put(update_url, json=data, headers=self.get_headers())
+        response = self.request('PUT', update_url, json=data)
         if response.status_code == 200:
             print(f"Precio de comparación actualizado para el sku {sku}")
         else:
             print(f"Error al actualizar el precio de comparación para el {sku}: {response.text}")
 
-        print("durmiendo...")
-        time.sleep(1)             
+    def update_prices_bulk(self, df, sku_column='sku', price_column='price', compare_at_column='compare_at_price', products_per_request=10):
+        """
+        Update price and/or compare-at price for many variants with productVariantsBulkUpdate.
+
+        Args:
+            df (pandas.DataFrame): One row per SKU. Missing columns and NaN
+                values leave that field unchanged.
+            sku_column, price_column, compare_at_column (str): Column names
+            products_per_request (int): Products updated per GraphQL call
+
+        Returns:
+            pandas.DataFrame: Input rows plus 'status' ('updated', 'not_found',
+                'error') and 'error' columns
+        """
+        results = df.copy()
+        results['status'] = None
+        results['error'] = None
+
+        variants = self._read_variants_by_skus(results[sku_column].dropna().astype(str).unique())
+
+        # Group the variant inputs by product, remembering which row each one came from
+        by_product = {}
+        for index, row in results.iterrows():
+            variant = variants.get(str(row[sku_column]))
+            if not variant:
+                results.at[index, 'status'] = 'not_found'
+                continue
+            variant_input = {'id': variant['variant_id']}
+            if price_column in results.columns and pd.notna(row[price_column]):
+                variant_input['price'] = str(row[price_column])
+            if compare_at_column in results.columns and pd.notna(row[compare_at_column]):
+                variant_input['compareAtPrice'] = str(row[compare_at_column])
+            by_product.setdefault(variant['product_id'], []).append((index, variant_input))
+
+        product_ids = list(by_product)
+        for start in range(0, len(product_ids), products_per_request):
+            chunk = product_ids[start:start + products_per_request]
+            definitions, fields, variables = [], [], {}
+            for i, product_id in enumerate(chunk):
+                definitions.append(f"$p{i}: ID!, $v{i}: [ProductVariantsBulkInput!]!")
+                fields.append(f"u{i}: productVariantsBulkUpdate(productId: $p{i}, variants: $v{i}) {{ userErrors {{ field message }} }}")
+                variables[f"p{i}"] = product_id
+                variables[f"v{i}"] = [variant_input for _, variant_input in by_product[product_id]]
+            mutation = f"mutation({', '.join(definitions)}) {{ {' '.join(fields)} }}"
+
+            try:
+                data = self.graphql(mutation, variables, estimated_cost=10 * len(chunk))
+            except Exception as e:
+                for product_id in chunk:
+                    for index, _ in by_product[product_id]:
+                        results.at[index, 'status'] = 'error'
+                        results.at[index, 'error'] = str(e)
+                continue
+
+            for i, product_id in enumerate(chunk):
+                rows = by_product[product_id]
+                row_errors = self._map_user_errors(data[f"u{i}"]['userErrors'], 'variants', len(rows))
+                for position, (index, _) in enumerate(rows):
+                    error = row_errors.get(position)
+                    results.at[index, 'status'] = 'error' if error else 'updated'
+                    results.at[index, 'error'] = error
+            print(f"Precios actualizados: {min(start + products_per_request, len(product_ids))}/{len(product_ids)} productos")
+
+        return results
+
+    def update_stock_bulk(self, df, sku_column='sku', stock_column='stock', location_id=None, chunk_size=250):
+        """
+        Set available stock for many variants with inventorySetQuantities.
+
+        Args:
+            df (pandas.DataFrame): One row per SKU with the new available quantity
+            sku_column, stock_column (str): Column names
+            location_id (int or str, optional): Location to update. By default each
+                item's first inventory location is used, as in update_stock.
+            chunk_size (int): Quantities per mutation (Shopify allows 250)
+
+        Returns:
+            pandas.DataFrame: Input rows plus 'status' ('updated', 'not_found',
+                'error') and 'error' columns
+        """
+        results = df.copy()
+        results['status'] = None
+        results['error'] = None
+
+        variants = self._read_variants_by_skus(results[sku_column].dropna().astype(str).unique())
+        fixed_location = self.to_gid('Location', location_id) if location_id else None
+
+        pending = []
+        for index, row in results.iterrows():
+            variant = variants.get(str(row[sku_column]))
+            location = fixed_location or (variant or {}).get('location_id')
+            if not variant or not location or pd.isna(row[stock_column]):
+                results.at[index, 'status'] = 'not_found'
+                continue
+            pending.append((index, {
+                'inventoryItemId': variant['inventory_item_id'],
+                'locationId': location,
+                'quantity': int(row[stock_column])
+            }))
+
+        mutation = """
+        mutation inventorySetQuantities($input: InventorySetQuantitiesInput!) {
+            inventorySetQuantities(input: $input) {
+                userErrors { field message }
+            }
+        }
+        """
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            variables = {'input': {
+                'name': 'available',
+                'reason': 'correction',
+                'ignoreCompareQuantity': True,
+                'quantities': [quantity for _, quantity in chunk]
+            }}
+            try:
+                data = self.graphql(mutation, variables, estimated_cost=10)
+                row_errors = self._map_user_errors(data['inventorySetQuantities']['userErrors'], 'quantities', len(chunk))
+            except Exception as e:
+                row_errors = {position: str(e) for position in range(len(chunk))}
+
+            for position, (index, _) in enumerate(chunk):
+                error = row_errors.get(position)
+                results.at[index, 'status'] = 'error' if error else 'updated'
+                results.at[index, 'error'] = error
+            print(f"Stock actualizado: {min(start + chunk_size, len(pending))}/{len(pending)} SKUs")
+
+        return results
 
     def delete_complementary_products(self, product_id):
         endpoint = f"products/{product_id}/metafields.json"
         url = urljoin(self.base_url, endpoint)
         
-        response = requests.get(url, headers=self.get_headers())
+        response = self.request('GET', url)
         if response.status_code == 200:
             metafields = response.json().get('metafields', [])
             complementary_metafield = next((m for m in metafields if m['namespace'] == "shopify--discovery--product_recommendation" and m['key'] == "complementary_products"), None)
@@ -317,7 +622,7 @@ class ShopifyProducts(ShopifyAPI):
             if complementary_metafield:
                 metafield_id = complementary_metafield['id']
                 delete_url = urljoin(self.base_url, f"metafields/{metafield_id}.json")
-                response = requests.delete(delete_url, headers=self.get_headers())
+                response = self.request('DELETE', delete_url)
                 
                 if response.status_code != 200:
                     print(f"Failed to delete complementary products for product {product_id}: {response.status_code} - {response.text}")
@@ -331,12 +636,184 @@ class ShopifyProducts(ShopifyAPI):
             json.dump(products, file, ensure_ascii=False, indent=4)
     
     def map_sku_to_product_id(self):
-        sku_to_product_id = {}
-        products = self.read_all_products()
-        for product in products:
+        return self.sku_to_product_id
+
+    def refresh_sku_index(self, full=False):
+        """
+        Bring the SKU index up to date and save it to sku_cache_path.
+
+        Only products with updated_at >= the last sync are downloaded. Deleted
+        products are only dropped by a full rebuild (full=True).
+
+        Returns:
+            dict: The refreshed index
+        """
+        index = None if full else self._load_sku_index()
+        if index is None:
+            index = {'synced_at': None, 'skus': {}, 'locations': {}}
+
+        params = {'updated_at_min': index['synced_at']} if index['synced_at'] else None
+
+        # product_id -> its SKUs, so replacing a product's variants doesn't scan every SKU
+        product_skus = {}
+        for sku, entry in index['skus'].items():
+            product_skus.setdefault(entry['product_id'], set()).add(sku)
+
+        # Pages come in id order, not updated_at order, so the watermark is only moved
+        # once every page was read; a failed page raises and nothing is saved
+        synced_at = index['synced_at']
+        updated = 0
+        for product in self.iter_products(fields=['id', 'updated_at', 'variants'], params=params):
+            # Drop SKUs that used to belong to this product (renamed or removed variants)
+            for sku in product_skus.pop(product['id'], ()):
+                if index['skus'].get(sku, {}).get('product_id') == product['id']:
+                    del index['skus'][sku]
             for variant in product['variants']:
-                sku = variant['sku']
-                product_id = product['id']
-                if sku:
-                    sku_to_product_id[sku] = product_id
-        return sku_to_product_id
+                if variant['sku']:
+                    previous = index['skus'].get(variant['sku'])
+                    if previous and previous['product_id'] != product['id']:
+                        product_skus.get(previous['product_id'], set()).discard(variant['sku'])
+                    index['skus'][variant['sku']] = {
+                        'product_id': product['id'],
+                        'variant_id': variant['id'],
+                        'inventory_item_id': variant['inventory_item_id']
+                    }
+                    product_skus.setdefault(product['id'], set()).add(variant['sku'])
+            if not synced_at or datetime.fromisoformat(product['updated_at']) > datetime.fromisoformat(synced_at):
+                synced_at = product['updated_at']
+            updated += 1
+
+        index['synced_at'] = synced_at
+        self._fill_sku_index_locations(index)
+        self._sku_index = index
+        self._save_sku_index(index)
+        print(f"Índice de SKUs actualizado: {updated} productos, {len(index['skus'])} SKUs")
+        return index
+
+    def _load_sku_index(self):
+        if not os.path.exists(self.sku_cache_path):
+            return None
+        try:
+            with open(self.sku_cache_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"No se pudo leer el índice de SKUs ({e}); se reconstruirá")
+            return None
+
+    def _save_sku_index(self, index):
+        os.makedirs(os.path.dirname(self.sku_cache_path), exist_ok=True)
+        tmp_path = f"{self.sku_cache_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+        os.replace(tmp_path, self.sku_cache_path)
+
+    def _fill_sku_index_locations(self, index, items_per_request=50):
+        # Resolve the first inventory location of every item missing one, 50 items per call
+        missing = sorted({
+            str(entry['inventory_item_id']) for entry in index['skus'].values()
+            if entry.get('inventory_item_id') and str(entry['inventory_item_id']) not in index['locations']
+        })
+        for start in range(0, len(missing), items_per_request):
+            item_ids = ",".join(missing[start:start + items_per_request])
+            for level in self.iter_records('inventory_levels.json', 'inventory_levels', params={'inventory_item_ids': item_ids}):
+                index['locations'].setdefault(str(level['inventory_item_id']), level['location_id'])
+
+    def _read_variants_by_skus(self, skus, skus_per_query=50):
+        """
+        Look up variant, product, inventory item and first location GIDs for many SKUs.
+        SKUs in the local index are resolved without network calls; the rest
+        are searched through GraphQL.
+
+        Returns:
+            dict: sku -> {'variant_id', 'product_id', 'inventory_item_id', 'location_id'}
+        """
+        variants = {}
+        missing = []
+        for sku in skus:
+            entry = self.sku_index['skus'].get(sku)
+            if not entry:
+                missing.append(sku)
+                continue
+            location_id = self.sku_index['locations'].get(str(entry['inventory_item_id']))
+            variants[sku] = {
+                'variant_id': self.to_gid('ProductVariant', entry['variant_id']),
+                'product_id': self.to_gid('Product', entry['product_id']),
+                'inventory_item_id': self.to_gid('InventoryItem', entry['inventory_item_id']),
+                'location_id': self.to_gid('Location', location_id) if location_id else None
+            }
+        if missing:
+            variants.update(self._search_variants_by_skus(missing, skus_per_query))
+        return variants
+
+    def _read_product_image_media_ids(self, product_ids, media_per_product=50):
+        """
+        Map REST product image IDs to the MediaImage GIDs productUpdateMedia expects.
+
+        Returns:
+            dict: image_id (int) -> media GID
+        """
+        query = """
+        query productMedia($ids: [ID!]!, $first: Int!) {
+            nodes(ids: $ids) {
+                ... on Product {
+                    media(first: $first) {
+                        nodes {
+                            id
+                            ... on MediaImage { image { id } }
+                        }
+                    }
+                }
+            }
+        }
+        """
+        variables = {'ids': [self.to_gid('Product', product_id) for product_id in product_ids], 'first': media_per_product}
+        data = self.graphql(query, variables, estimated_cost=len(product_ids) * (media_per_product + 2))
+
+        media_ids = {}
+        for node in data['nodes']:
+            for media in (node or {}).get('media', {}).get('nodes', []):
+                # MediaImage.image.id is the ProductImage GID, i.e. the REST image ID
+                if media.get('image') and media['image'].get('id'):
+                    media_ids[self.from_gid(media['image']['id'])] = media['id']
+        return media_ids
+
+    def _search_variants_by_skus(self, skus, skus_per_query=50):
+        query = """
+        query variantsBySku($query: String!, $after: String) {
+            productVariants(first: 100, query: $query, after: $after) {
+                pageInfo { hasNextPage endCursor }
+                nodes {
+                    id
+                    sku
+                    product { id }
+                    inventoryItem {
+                        id
+                        inventoryLevels(first: 1) { nodes { location { id } } }
+                    }
+                }
+            }
+        }
+        """
+        skus = list(skus)
+        variants = {}
+        for start in range(0, len(skus), skus_per_query):
+            chunk = skus[start:start + skus_per_query]
+            search = " OR ".join('sku:"{}"'.format(sku.replace('"', '\\"')) for sku in chunk)
+            after = None
+            while True:
+                data = self.graphql(query, {'query': search, 'after': after}, estimated_cost=300)['productVariants']
+                for node in data['nodes']:
+                    # The search is tokenized, so keep only exact matches
+                    if node['sku'] not in chunk or node['sku'] in variants:
+                        continue
+                    levels = node['inventoryItem']['inventoryLevels']['nodes']
+                    variants[node['sku']] = {
+                        'variant_id': node['id'],
+                        'product_id': node['product']['id'],
+                        'inventory_item_id': node['inventoryItem']['id'],
+                        'location_id': levels[0]['location']['id'] if levels else None
+                    }
+                if not data['pageInfo']['hasNextPage']:
+                    break
+                after = data['pageInfo']['endCursor']
+        return variants
@@ -2,6 +2,7 @@ from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
 import os
+import time
 
 class SlackMessages:
     def __init__(self):
@@ -181,6 +182,53 @@ class SlackMessages:
             print(f"Error actualizando mensaje: {e.response['error']}")
             return None
 
+    def stream_message(self, channel: str, events, thread_ts: str = None, min_interval: float = 1.0, placeholder: str = "...") -> dict:
+        """
+        Publica un mensaje y lo va actualizando a medida que llega el texto,
+        por ejemplo desde LLM.generate_text(..., stream=True)
+
+        Args:
+            channel (str): ID o nombre del canal
+            events (iterable): Eventos {'type': 'delta'|'done'|'error', 'text': ...} o strings sueltos
+            thread_ts (str, optional): ID del mensaje padre si se responde en un hilo
+            min_interval (float): Segundos mínimos entre actualizaciones (límite de chat.update)
+            placeholder (str): Texto inicial mientras llega el primer fragmento
+
+        Returns:
+            dict: Información del mensaje publicado, con el texto final en 'text'
+        """
+        if thread_ts:
+            message = self.create_thread_message(channel, thread_ts, placeholder)
+        else:
+            message = self.create_channel_message(channel, placeholder)
+        if not message:
+            return None
+
+        text = ""
+        shown = placeholder
+        # El primer fragmento se muestra de inmediato; los siguientes se agrupan
+        last_update = float('-inf')
+        for event in events:
+            if isinstance(event, str):
+                text += event
+            elif event.get('type') == 'delta':
+                text += event['text']
+            elif event.get('type') == 'done':
+                text = event['text']
+            elif event.get('type') == 'error':
+                text = f"{event.get('text', '')}\n_(Error: {event['error']})_"
+
+            # Se actualiza a lo más cada min_interval segundos para no gatillar el rate limit
+            if text and text != shown and time.monotonic() - last_update >= min_interval:
+                self.update_message(message['channel'], message['message_id'], text)
+                shown = text
+                last_update = time.monotonic()
+
+        if text and text != shown:
+            self.update_message(message['channel'], message['message_id'], text)
+        message['text'] = text
+        return message
+
     # DELETE operations
     def delete_message(self, channel: str, message_ts: str) -> bool:
         """